@@ -1,15 +1,124 @@
 import base64
+from collections.abc import Mapping
 
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from rest_framework import serializers
+from rest_framework.exceptions import ErrorDetail
+from rest_framework.fields import SkipField
+from rest_framework.relations import MANY_RELATION_KWARGS, ManyRelatedField
+
+from recipes.thumbnails import thumbnail_names
 
 
 class Base64ImageField(serializers.ImageField):
-    """Кастомный тип поля Base64ImageField."""
+    """Кастомный тип поля Base64ImageField.
+        Принимает и файл из multipart-запроса, и строку base64;
+        размер и стороны картинки ограничены настройками."""
+
+    default_error_messages = {
+        'max_size': 'Размер картинки не должен превышать {max_size} байт.',
+        'max_dimension': ('Стороны картинки не должны превышать '
+                          '{max_dimension} пикселей.'),
+    }
 
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
+            format, _, imgstr = data.partition(';base64,')
+            if len(imgstr) // 4 * 3 > settings.RECIPE_IMAGE_MAX_SIZE:
+                self.fail('max_size', max_size=settings.RECIPE_IMAGE_MAX_SIZE)
             ext = format.split('/')[-1]
             data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
-        return super().to_internal_value(data)
+        if getattr(data, 'size', 0) > settings.RECIPE_IMAGE_MAX_SIZE:
+            self.fail('max_size', max_size=settings.RECIPE_IMAGE_MAX_SIZE)
+        image_file = super().to_internal_value(data)
+        image = getattr(image_file, 'image', None)
+        if image is not None and max(image.size) > (
+                settings.RECIPE_IMAGE_MAX_DIMENSION):
+            self.fail('max_dimension',
+                      max_dimension=settings.RECIPE_IMAGE_MAX_DIMENSION)
+        return image_file
+
+
+class ThumbnailsField(serializers.Field):
+    """Ссылки на миниатюры картинки рецепта по размерам и форматам.
+        Пока миниатюры не готовы, везде отдается ссылка на оригинал."""
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def get_attribute(self, instance):
+        if isinstance(instance, Mapping):
+            raise SkipField()
+        return instance
+
+    def build_url(self, name):
+        url = default_storage.url(name)
+        request = self.context.get('request')
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+    def to_representation(self, recipe):
+        if not recipe.image:
+            return None
+        names = thumbnail_names(recipe.image.name)
+        if recipe.thumbnails_for != recipe.image.name:
+            original = self.build_url(recipe.image.name)
+            return {
+                variant: {extension: original for extension in formats}
+                for variant, formats in names.items()
+            }
+        return {
+            variant: {extension: self.build_url(name)
+                      for extension, name in formats.items()}
+            for variant, formats in names.items()
+        }
+
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """Первичный ключ, который при разборе проверяется только по типу.
+        Объекты для всего списка загружаются одним запросом в get_objects."""
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
+
+    def to_internal_value(self, data):
+        try:
+            if isinstance(data, bool):
+                raise TypeError
+            return self.get_queryset().model._meta.pk.to_python(data)
+        except (TypeError, ValueError, DjangoValidationError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+    def get_objects(self, pks):
+        return self.get_queryset().in_bulk(set(pks))
+
+    def does_not_exist(self, pk):
+        """Та же ошибка, что у PrimaryKeyRelatedField, вместе с кодом."""
+        return ErrorDetail(
+            self.error_messages['does_not_exist'].format(pk_value=pk),
+            code='does_not_exist')
+
+
+class BulkManyRelatedField(ManyRelatedField):
+    """Список объектов по первичным ключам, загружаемый одним запросом."""
+
+    def to_internal_value(self, data):
+        pks = super().to_internal_value(data)
+        objects = self.child_relation.get_objects(pks)
+        for pk in pks:
+            if pk not in objects:
+                raise serializers.ValidationError(
+                    self.child_relation.does_not_exist(pk),
+                    code='does_not_exist')
+        return [objects[pk] for pk in pks]
@@ -1,8 +1,10 @@
+from django.db.models import Case, IntegerField, Value, When
 from django_filters.rest_framework import (FilterSet,
                                            ModelMultipleChoiceFilter, filters)
 
 from recipes.models import Recipe, Tag
 from users.models import User
+from .search import rank_queryset, rank_rows, uses_trigram_index
 
 
 class RecipeFilter(FilterSet):
@@ -15,6 +17,7 @@ class RecipeFilter(FilterSet):
     author = filters.ModelChoiceFilter(queryset=User.objects.all())
     is_favorited = filters.BooleanFilter(method='filter_favorited')
     is_in_shopping_cart = filters.BooleanFilter(method='filter_shopping_cart')
+    search = filters.CharFilter(method='filter_search')
 
     def filter_favorited(self, queryset, name, value):
         if value and self.request.user.is_authenticated:
@@ -27,6 +30,21 @@ class RecipeFilter(FilterSet):
                 shopping_cart_recipe__user=self.request.user)
         return queryset
 
+    def filter_search(self, queryset, name, value):
+        """Ранжированный поиск по названию рецепта.
+            Без PostgreSQL ранжирование выполняется в памяти."""
+        if uses_trigram_index():
+            return rank_queryset(queryset, value)
+        ranked_ids = [row['id'] for row in rank_rows(
+            queryset.prefetch_related(None).values('id', 'name'), value)]
+        if not ranked_ids:
+            return queryset.none()
+        return queryset.filter(pk__in=ranked_ids).order_by(Case(
+            *[When(pk=pk, then=Value(position))
+              for position, pk in enumerate(ranked_ids)],
+            output_field=IntegerField(),
+        ))
+
     class Meta:
         model = Recipe
         fields = ('tags', 'author')
@@ -0,0 +1,54 @@
+import threading
+from bisect import bisect_left
+
+from recipes.models import Ingredient
+from recipes.versions import INGREDIENTS_VERSION, get_version
+
+
+class IngredientPrefixIndex:
+    """Индекс ингредиентов в памяти процесса для поиска по началу названия.
+        Хранит отсортированный список названий в нижнем регистре
+        и перестраивается при смене версии каталога."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._data = ([], [])
+
+    def _build(self):
+        rows = sorted(
+            Ingredient.objects.values('id', 'name', 'measurement_unit'),
+            key=lambda row: (row['name'].casefold(), row['id'])
+        )
+        return [row['name'].casefold() for row in rows], rows
+
+    def _ensure_fresh(self):
+        version = get_version(INGREDIENTS_VERSION)
+        if version == self._version:
+            return
+        with self._lock:
+            if version != self._version:
+                self._data = self._build()
+                self._version = version
+
+    def rows(self):
+        """Все ингредиенты каталога в порядке названий."""
+        self._ensure_fresh()
+        return self._data[1]
+
+    def search(self, prefix='', limit=None):
+        """Ингредиенты, название которых начинается с prefix."""
+        self._ensure_fresh()
+        keys, rows = self._data
+        prefix = prefix.casefold()
+        result = []
+        position = bisect_left(keys, prefix)
+        while position < len(keys) and keys[position].startswith(prefix):
+            if limit is not None and len(result) >= limit:
+                break
+            result.append(rows[position])
+            position += 1
+        return result
+
+
+ingredient_index = IngredientPrefixIndex()
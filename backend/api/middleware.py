@@ -0,0 +1,101 @@
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER_LISTS = re.compile(r'%s(?:\s*,\s*%s)+')
+NUMBERS = re.compile(r'\b\d+\b')
+TOP_SHAPES = 5
+
+
+def sql_shape(sql):
+    """Запрос без конкретных значений: списки параметров IN
+        и числа заменены, чтобы одинаковые запросы совпадали."""
+    return NUMBERS.sub('N', PLACEHOLDER_LISTS.sub('%s...', sql))
+
+
+def view_name(request):
+    """Имя обработчика вида RecipeViewSet.list."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return None
+    view = match.func
+    view_class = getattr(view, 'cls', None) or getattr(
+        view, 'view_class', None)
+    if view_class is None:
+        return f'{view.__module__}.{view.__name__}'
+    actions = getattr(view, 'actions', None) or {}
+    action = actions.get(request.method.lower(), request.method.lower())
+    return f'{view_class.__name__}.{action}'
+
+
+class QueryRecorder:
+    """Обертка выполнения запросов: количество, время и формы SQL."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.shapes[sql_shape(sql)] += 1
+
+
+class SQLInstrumentationMiddleware:
+    """Подсчет запросов к БД и их времени для каждого HTTP-запроса.
+        Добавляет заголовки Server-Timing и X-Query-Count и пишет в лог
+        медленные запросы. При SQL_INSTRUMENTATION = False middleware
+        отключается при запуске и не влияет на обработку запросов."""
+
+    def __init__(self, get_response):
+        if not settings.SQL_INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+        db_ms = recorder.duration * 1000
+        app_ms = duration * 1000 - db_ms
+        response['Server-Timing'] = (
+            f'db;dur={db_ms:.1f}, app;dur={app_ms:.1f}')
+        response['X-Query-Count'] = str(recorder.count)
+        if (duration * 1000 >= settings.SLOW_REQUEST_MS
+                or recorder.count >= settings.SLOW_REQUEST_QUERIES):
+            self.log_slow_request(request, response, recorder, duration)
+        return response
+
+    def log_slow_request(self, request, response, recorder, duration):
+        logger.warning('slow request %s', json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'view': view_name(request),
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 1),
+            'db_ms': round(recorder.duration * 1000, 1),
+            'queries': recorder.count,
+            'repeated': [
+                {'sql': shape, 'count': count}
+                for shape, count in recorder.shapes.most_common(TOP_SHAPES)
+                if count > 1
+            ],
+        }, ensure_ascii=False))
@@ -0,0 +1,109 @@
+import hashlib
+
+from django.core.cache import cache
+from django.utils.cache import patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+from rest_framework import status
+from rest_framework.response import Response
+
+from backend.settings import RESPONSE_CACHE_TIMEOUT
+from recipes.versions import get_version, version_timestamp
+
+
+class ConditionalGetMixin:
+    """Условные GET-запросы для справочных данных.
+        ETag и Last-Modified вычисляются по версии данных etag_version,
+        поэтому ответ 304 отдается без обращения к БД и сериализатору."""
+
+    etag_version = None
+    cache_max_age = 60
+
+    def get_etag(self, request, version):
+        variant = '{}:{}:{}'.format(
+            version,
+            request.get_full_path(),
+            request.accepted_renderer.format,
+        )
+        return '"{}"'.format(hashlib.md5(variant.encode()).hexdigest())
+
+    def is_not_modified(self, request, etag, last_modified):
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match is not None:
+            etags = [tag.strip() for tag in if_none_match.split(',')]
+            return '*' in etags or etag in etags
+        if_modified_since = parse_http_date_safe(
+            request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+        return (if_modified_since is not None
+                and last_modified <= if_modified_since)
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        version = get_version(self.etag_version)
+        etag = self.get_etag(request, version)
+        last_modified = version_timestamp(version)
+        if self.is_not_modified(request, etag, last_modified):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (status.HTTP_200_OK,
+                                    status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+            patch_cache_control(
+                response, public=True, max_age=self.cache_max_age)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().retrieve, request, *args, **kwargs)
+
+
+class AnonymousResponseCacheMixin:
+    """Кеширование ответов list и retrieve для анонимных пользователей.
+        Ключ строится по нормализованным параметрам запроса и версии
+        данных response_cache_version, поэтому сброс кеша выполняется
+        сменой версии."""
+
+    response_cache_version = None
+    response_cache_timeout = RESPONSE_CACHE_TIMEOUT
+
+    def get_response_cache_key(self, request):
+        params = sorted(
+            (key, sorted(values))
+            for key, values in request.query_params.lists()
+        )
+        variant = '{}:{}:{}:{}:{}'.format(
+            request.get_host(),
+            self.action,
+            self.kwargs.get(self.lookup_url_kwarg or self.lookup_field),
+            params,
+            request.accepted_renderer.format,
+        )
+        return 'response:{}:{}:{}'.format(
+            type(self).__name__,
+            get_version(self.response_cache_version),
+            hashlib.md5(variant.encode()).hexdigest(),
+        )
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if not request.user.is_anonymous:
+            return handler(request, *args, **kwargs)
+        cache_key = self.get_response_cache_key(request)
+        data = cache.get(cache_key)
+        if data is not None:
+            return Response(data)
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(cache_key, response.data, self.response_cache_timeout)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs)
@@ -1,8 +1,143 @@
-from rest_framework.pagination import PageNumberPagination
+import hashlib
+from functools import partial
 
-from backend.settings import DEFAULT_RECIPES_LIMIT
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connection
+from django.utils.functional import cached_property
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+from backend.settings import (COUNT_CACHE_TIMEOUT, COUNT_ESTIMATE_THRESHOLD,
+                              DEFAULT_RECIPES_LIMIT)
+from recipes.versions import get_version, user_version_name
+
+PAGINATION_QUERY_PARAMS = ('page', 'limit', 'pagination', 'cursor')
+
+
+class CountedPaginator(Paginator):
+    """Paginator, получающий общее количество через count_getter."""
+
+    def __init__(self, object_list, per_page, count_getter=None, **kwargs):
+        self.count_getter = count_getter
+        super().__init__(object_list, per_page, **kwargs)
+
+    @cached_property
+    def count(self):
+        if self.count_getter is None:
+            return super().count
+        return self.count_getter(self.object_list)
 
 
 class CustomPageNumberPagination(PageNumberPagination):
+    """Постраничная пагинация.
+        Для представлений с атрибутом count_cache_version общее количество
+        кешируется по набору фильтров, а для больших таблиц без фильтров
+        может оцениваться планировщиком PostgreSQL."""
+
     page_size_query_param = "limit"
     page_size = DEFAULT_RECIPES_LIMIT
+    count_cache_timeout = COUNT_CACHE_TIMEOUT
+    count_estimate_threshold = COUNT_ESTIMATE_THRESHOLD
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.django_paginator_class = partial(
+            CountedPaginator,
+            count_getter=self.get_count_getter(request, view))
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_filter_params(self, request):
+        """Нормализованный набор параметров фильтрации."""
+        return tuple(sorted(
+            (key, tuple(sorted(values)))
+            for key, values in request.query_params.lists()
+            if key not in PAGINATION_QUERY_PARAMS
+        ))
+
+    def get_count_getter(self, request, view):
+        version_name = getattr(view, 'count_cache_version', None)
+        if version_name is None:
+            return None
+        filter_params = self.get_filter_params(request)
+        user_id = request.user.id or 0
+        cache_key = 'count:{}:{}:{}:{}:{}:{}'.format(
+            type(view).__name__,
+            getattr(view, 'action', None),
+            user_id,
+            get_version(version_name),
+            get_version(user_version_name(version_name, user_id)),
+            hashlib.md5(repr(filter_params).encode()).hexdigest(),
+        )
+
+        def count_getter(queryset):
+            count = cache.get(cache_key)
+            if count is None:
+                count = self.get_estimated_count(queryset, filter_params)
+            if count is None:
+                count = queryset.count()
+                cache.set(cache_key, count, self.count_cache_timeout)
+            return count
+
+        return count_getter
+
+    def get_estimated_count(self, queryset, filter_params):
+        """Оценка количества строк по статистике планировщика PostgreSQL.
+            Используется только для списка без фильтров."""
+        if (not self.count_estimate_threshold or filter_params
+                or connection.vendor != 'postgresql'):
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+                [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        if row is None or row[0] < self.count_estimate_threshold:
+            return None
+        return row[0]
+
+
+class CustomCursorPagination(CursorPagination):
+    """Курсорная пагинация без COUNT(*) и OFFSET.
+        Порядок берется из атрибута cursor_ordering представления."""
+
+    page_size_query_param = "limit"
+    page_size = DEFAULT_RECIPES_LIMIT
+    ordering = ('-pub_date', '-id')
+
+    def get_ordering(self, request, queryset, view):
+        return getattr(view, 'cursor_ordering', self.ordering)
+
+
+class OptionalCursorPagination(CustomPageNumberPagination):
+    """Постраничная пагинация с переключением на курсорную
+        параметром pagination=cursor. Курсор требует постоянного порядка
+        cursor_ordering, поэтому с параметрами из cursor_excluded_params
+        представления, например ранжированным поиском, он не сочетается."""
+
+    cursor_query_param = 'pagination'
+    cursor_query_value = 'cursor'
+    cursor_pagination_class = CustomCursorPagination
+
+    def use_cursor(self, request):
+        return (request.query_params.get(self.cursor_query_param)
+                == self.cursor_query_value)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if self.use_cursor(request):
+            excluded = [
+                param for param in getattr(view, 'cursor_excluded_params', ())
+                if request.query_params.get(param)]
+            if excluded:
+                raise ValidationError({self.cursor_query_param: [
+                    'Курсорная пагинация недоступна с параметрами: '
+                    + ', '.join(excluded)]})
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,75 @@
+import json
+
+from django.conf import settings
+from django.core.files.uploadhandler import (FileUploadHandler,
+                                             TemporaryFileUploadHandler)
+from django.http.multipartparser import MultiPartParser as DjangoParser
+from django.http.multipartparser import MultiPartParserError
+from rest_framework.exceptions import ParseError, ValidationError
+from rest_framework.parsers import DataAndFiles, MultiPartParser
+
+IMAGE_TOO_LARGE = 'Размер картинки не должен превышать {} байт.'
+
+
+class ImageSizeLimitHandler(FileUploadHandler):
+    """Прерывает загрузку, как только файл превысил допустимый размер,
+        не дочитывая остаток тела запроса."""
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.RECIPE_IMAGE_MAX_SIZE:
+            raise ValidationError({self.field_name: [
+                IMAGE_TOO_LARGE.format(settings.RECIPE_IMAGE_MAX_SIZE)]})
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+
+class RecipeMultiPartParser(MultiPartParser):
+    """multipart/form-data для создания и изменения рецепта.
+        Картинка пишется во временный файл на диске по частям
+        и не держится в памяти целиком."""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        request = parser_context['request']
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        meta = request.META.copy()
+        meta['CONTENT_TYPE'] = media_type
+        upload_handlers = [
+            ImageSizeLimitHandler(request),
+            TemporaryFileUploadHandler(request),
+        ]
+        try:
+            data, files = DjangoParser(
+                meta, stream, upload_handlers, encoding).parse()
+        except MultiPartParserError as exc:
+            raise ParseError('Multipart form parse error - %s' % str(exc))
+        return DataAndFiles(data, files)
+
+
+def parse_form_lists(data, list_fields):
+    """Превращает данные формы в словарь. Списки из list_fields
+        передаются JSON-строкой или повторяющимися полями."""
+    form = {}
+    for key, values in data.lists():
+        if key not in list_fields:
+            form[key] = values[-1]
+            continue
+        try:
+            if len(values) == 1 and values[0].lstrip().startswith('['):
+                form[key] = json.loads(values[0])
+            else:
+                form[key] = [
+                    json.loads(value)
+                    if value.lstrip().startswith('{') else value
+                    for value in values
+                ]
+        except ValueError:
+            raise ParseError(f'Поле {key} должно содержать JSON.')
+    return form
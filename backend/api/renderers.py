@@ -0,0 +1,22 @@
+from rest_framework.renderers import JSONRenderer
+
+
+class ShoppingListTextRenderer(JSONRenderer):
+    """Формат txt для выгрузки списка покупок.
+        Сам файл отдается потоком, рендерер используется
+        для согласования формата и вывода ошибок."""
+
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+
+class ShoppingListCSVRenderer(ShoppingListTextRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class ShoppingListPDFRenderer(ShoppingListTextRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
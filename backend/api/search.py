@@ -0,0 +1,85 @@
+import re
+
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.functions import Upper
+
+PREFIX_MATCH = 0
+SUBSTRING_MATCH = 1
+FUZZY_MATCH = 2
+SIMILARITY_THRESHOLD = 0.3
+
+WORD_RE = re.compile(r'\w+')
+
+
+def uses_trigram_index():
+    """Поиск в БД через индексы pg_trgm доступен только в PostgreSQL."""
+    return connection.vendor == 'postgresql'
+
+
+def trigrams(text):
+    """Множество триграмм строки по правилам pg_trgm."""
+    result = set()
+    for word in WORD_RE.findall(text.casefold()):
+        padded = f'  {word} '
+        result.update(
+            padded[index:index + 3] for index in range(len(padded) - 2))
+    return result
+
+
+def similarity(first, second):
+    """Сходство строк по триграммам, аналог similarity() из pg_trgm."""
+    first, second = trigrams(first), trigrams(second)
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+def match_rank(name, query):
+    """Ранг совпадения названия с запросом и его сходство.
+        Возвращает None, если название не подходит."""
+    folded_name, folded_query = name.casefold(), query.casefold()
+    if folded_name.startswith(folded_query):
+        return PREFIX_MATCH, 1.0
+    if folded_query in folded_name:
+        return SUBSTRING_MATCH, 1.0
+    score = similarity(name, query)
+    if score >= SIMILARITY_THRESHOLD:
+        return FUZZY_MATCH, score
+    return None
+
+
+def rank_rows(rows, query, name=lambda row: row['name'], limit=None):
+    """Ранжирование записей в памяти: сначала совпадения по началу,
+        затем по подстроке, затем нечеткие по убыванию сходства."""
+    ranked = []
+    for row in rows:
+        rank = match_rank(name(row), query)
+        if rank is not None:
+            ranked.append((rank[0], -rank[1], name(row).casefold(), row))
+    ranked.sort(key=lambda item: item[:3])
+    return [item[3] for item in ranked[:limit]]
+
+
+def rank_queryset(queryset, query, field='name'):
+    """Ранжированный поиск в PostgreSQL.
+        Условия строятся по UPPER(field), чтобы использовать
+        GIN-индекс с gin_trgm_ops из миграции recipes.0006."""
+    from django.contrib.postgres.search import TrigramSimilarity
+
+    return queryset.annotate(
+        search_name=Upper(field),
+    ).filter(
+        Q(search_name__contains=query.upper())
+        | Q(search_name__trigram_similar=query)
+    ).annotate(
+        match_rank=Case(
+            When(search_name__startswith=query.upper(),
+                 then=Value(PREFIX_MATCH)),
+            When(search_name__contains=query.upper(),
+                 then=Value(SUBSTRING_MATCH)),
+            default=Value(FUZZY_MATCH),
+            output_field=IntegerField(),
+        ),
+        similarity=TrigramSimilarity('search_name', query),
+    ).order_by('match_rank', '-similarity', field)
@@ -1,11 +1,33 @@
+from collections import Counter, OrderedDict
+
+from django.core.cache import cache
 from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from rest_framework import serializers
 
+from recipes.aggregates import apply_recipe_change
 from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
                             ShoppingCart, Tag)
+from recipes.versions import (RECIPE_DATA_VERSION, RECIPE_FRAGMENTS_VERSION,
+                              bump_version, get_version)
 from users.models import Subscribtion, User
-from .fields import Base64ImageField
+from .fields import (Base64ImageField, BulkPrimaryKeyRelatedField,
+                     ThumbnailsField)
+from .parsers import parse_form_lists
+
+RECIPE_FRAGMENT_TIMEOUT = 60 * 60
+
+
+def recipe_prefetch_lookups():
+    """Связанные данные, необходимые для вывода рецепта."""
+    return (
+        'tags',
+        Prefetch(
+            'recipeingredient_set',
+            queryset=RecipeIngredient.objects.select_related('ingredient')
+        ),
+    )
 
 
 class RecipeLiteSerializer(serializers.ModelSerializer):
@@ -13,13 +35,25 @@ class RecipeLiteSerializer(serializers.ModelSerializer):
         Используется как вложенный сериализатор."""
 
     image = Base64ImageField(read_only=True)
+    thumbnails = ThumbnailsField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'thumbnails', 'cooking_time')
         read_only_fields = ('id', 'name', 'cooking_time')
 
 
+def get_subscribed_author_ids(request):
+    """Множество id авторов, на которых подписан текущий пользователь.
+        Загружается один раз за запрос и кешируется на объекте request."""
+    if not hasattr(request, '_subscribed_author_ids'):
+        request._subscribed_author_ids = set(
+            Subscribtion.objects.filter(
+                user=request.user).values_list('author_id', flat=True)
+        )
+    return request._subscribed_author_ids
+
+
 class CustomUserSerializer(UserSerializer):
     """Сериализатор для пользователя."""
 
@@ -33,10 +67,10 @@ class CustomUserSerializer(UserSerializer):
     def get_is_subscribed(self, obj):
         """Метод, который показывает,
             подписан ли текущий пользователь на просматриваемого."""
-        user = self.context.get('request').user
-        if user.is_anonymous:
+        request = self.context.get('request')
+        if request is None or request.user.is_anonymous:
             return False
-        return Subscribtion.objects.filter(user=user, author=obj.id).exists()
+        return obj.id in get_subscribed_author_ids(request)
 
 
 class CustomUserCreateSerializer(UserCreateSerializer):
@@ -70,16 +104,21 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         """Метод, который показывает,
             подписан ли текущий пользователь на просматриваемого."""
         user = self.context.get('request').user
-        if not user.is_anonymous:
-            return Subscribtion.objects.filter(
-                user=obj.user,
-                author=obj.author).exists()
-        return False
+        if user.is_anonymous:
+            return False
+        if obj.pk is not None and obj.user_id == user.id:
+            return True
+        return Subscribtion.objects.filter(
+            user=obj.user,
+            author=obj.author).exists()
 
     def get_recipes(self, obj):
         """Получение всех рецептов конкретного пользователя
             с учетом количества обЪектов внутри поля recipes."""
         request = self.context.get('request')
+        if hasattr(obj.author, 'limited_recipes'):
+            return RecipeLiteSerializer(
+                obj.author.limited_recipes, many=True).data
         limit = request.GET.get('recipes_limit')
         recipes = Recipe.objects.filter(author=obj.author)
         if limit and limit.isdigit():
@@ -87,8 +126,8 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         return RecipeLiteSerializer(recipes, many=True).data
 
     def get_recipes_count(self, obj):
-        """Получение количества рецептов пользователя."""
-        return Recipe.objects.filter(author=obj.author).count()
+        """Получение количества рецептов пользователя из счетчика."""
+        return obj.author.recipes_count
 
 
 class IngredientListSerializer(serializers.ModelSerializer):
@@ -122,6 +161,69 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         fields = ('name', 'id', 'amount', 'measurement_unit')
 
 
+class ShoppingListItemSerializer(serializers.Serializer):
+    """Сериализатор строки сводного списка покупок."""
+
+    id = serializers.ReadOnlyField(source='ingredient_id')
+    name = serializers.ReadOnlyField()
+    measurement_unit = serializers.ReadOnlyField(source='units')
+    amount = serializers.ReadOnlyField(source='total')
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    """Список id рецептов для массового добавления и удаления."""
+
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=100,
+    )
+
+
+class RecipeFragmentListSerializer(serializers.ListSerializer):
+    """Вывод списка рецептов из закешированных фрагментов.
+        Общая для всех пользователей часть рецепта кешируется по id рецепта
+        и отметке его изменения и загружается одним get_many на страницу.
+        Изменение одного рецепта не сбрасывает фрагменты остальных.
+        Поля, зависящие от пользователя, подставляются поверх фрагмента."""
+
+    def get_fragment_key(self, recipe, version):
+        request = self.context.get('request')
+        return 'recipe-fragment:{}:{}://{}:{}:{}'.format(
+            version, request.scheme, request.get_host(), recipe.id,
+            recipe.updated.isoformat())
+
+    def to_representation(self, data):
+        recipes = list(data.all() if hasattr(data, 'all') else data)
+        version = get_version(RECIPE_FRAGMENTS_VERSION)
+        keys = {recipe.id: self.get_fragment_key(recipe, version)
+                for recipe in recipes}
+        fragments = cache.get_many(list(keys.values()))
+        missing = [recipe for recipe in recipes
+                   if keys[recipe.id] not in fragments]
+        if missing:
+            prefetch_related_objects(missing, *recipe_prefetch_lookups())
+            rendered = {
+                keys[recipe.id]: self.child.to_representation(recipe)
+                for recipe in missing
+            }
+            cache.set_many(rendered, RECIPE_FRAGMENT_TIMEOUT)
+            fragments.update(rendered)
+        return [self.overlay_user_fields(fragments[keys[recipe.id]], recipe)
+                for recipe in recipes]
+
+    def overlay_user_fields(self, fragment, recipe):
+        """Подстановка полей текущего пользователя во фрагмент."""
+        item = OrderedDict(fragment)
+        item['author'] = OrderedDict(fragment['author'])
+        item['author']['is_subscribed'] = self.child.fields[
+            'author'].get_is_subscribed(recipe.author)
+        item['is_favorited'] = self.child.get_is_favorited(recipe)
+        item['is_in_shopping_cart'] = self.child.get_is_in_shopping_cart(
+            recipe)
+        return item
+
+
 class RecipeFavoriteAndCartSerializer(serializers.ModelSerializer):
     """Сериализатор модели Recipe для чтения информации по рецептам."""
 
@@ -132,36 +234,64 @@ class RecipeFavoriteAndCartSerializer(serializers.ModelSerializer):
         many=True,
         read_only=True)
     ingredients = serializers.SerializerMethodField()
+    thumbnails = ThumbnailsField()
 
     def get_ingredients(self, obj):
         """Получение поля ингредиентов."""
         return RecipeIngredientSerializer(
-            RecipeIngredient.objects.filter(recipe=obj).all(), many=True
+            obj.recipeingredient_set.all(), many=True
         ).data
 
     def get_is_favorited(self, obj):
-        """Получение поля рецепт в избранном или нет."""
+        """Получение поля рецепт в избранном или нет.
+            Используется аннотация из queryset, если она есть."""
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user_id = self.context.get('request').user.id
         return Favorite.objects.filter(
             user=user_id, recipe=obj.id).exists()
 
     def get_is_in_shopping_cart(self, obj):
-        """Получение поля рецепт в корзине или нет."""
+        """Получение поля рецепт в корзине или нет.
+            Используется аннотация из queryset, если она есть."""
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user_id = self.context.get('request').user.id
         return ShoppingCart.objects.filter(
             user=user_id, recipe=obj.id).exists()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'tags', 'image', 'author', 'ingredients',
-                  'is_favorited', 'is_in_shopping_cart', 'name',
-                  'text', 'cooking_time')
+        fields = ('id', 'tags', 'image', 'thumbnails', 'author',
+                  'ingredients', 'is_favorited', 'is_in_shopping_cart',
+                  'name', 'text', 'cooking_time')
+        list_serializer_class = RecipeFragmentListSerializer
+
+
+class IngredientAmountListSerializer(serializers.ListSerializer):
+    """Список ингредиентов рецепта; все ингредиенты загружаются
+        одним запросом."""
+
+    def to_internal_value(self, data):
+        items = super().to_internal_value(data)
+        id_field = self.child.fields['id']
+        objects = id_field.get_objects(item['id'] for item in items)
+        errors = [
+            {} if item['id'] in objects
+            else {'id': [id_field.does_not_exist(item['id'])]}
+            for item in items
+        ]
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        for item in items:
+            item['id'] = objects[item['id']]
+        return items
 
 
 class IngredientAmountCreateSerializer(serializers.ModelSerializer):
     """Cериализатор количества ингредиентов в рецепте."""
 
-    id = serializers.PrimaryKeyRelatedField(
+    id = BulkPrimaryKeyRelatedField(
         queryset=Ingredient.objects.all()
     )
     amount = serializers.IntegerField()
@@ -169,18 +299,25 @@ class IngredientAmountCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = RecipeIngredient
         fields = ('id', 'amount')
+        list_serializer_class = IngredientAmountListSerializer
 
 
 class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
     """Сериализатор модели Recipe для создания и обновления рецепта."""
     ingredients = IngredientAmountCreateSerializer(write_only=True, many=True)
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = BulkPrimaryKeyRelatedField(
         many=True,
         queryset=Tag.objects.all()
     )
     image = Base64ImageField()
     author = CustomUserSerializer(required=False, read_only=True)
 
+    def to_internal_value(self, data):
+        """Данные multipart-формы приводятся к виду JSON-запроса."""
+        if hasattr(data, 'getlist'):
+            data = parse_form_lists(data, ('ingredients', 'tags'))
+        return super().to_internal_value(data)
+
     def validate(self, value):
         """Валидация ингредиентов."""
         if not value.get('ingredients'):
@@ -219,17 +356,66 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
         self.create_ingredients(ingredients_data, recipe)
         return recipe
 
+    def update_ingredients(self, instance, ingredients_data):
+        """Применение разницы между переданными и сохраненными
+            ингредиентами: меняются только отличающиеся записи."""
+        existing = {
+            row.ingredient_id: row
+            for row in RecipeIngredient.objects.select_for_update().filter(
+                recipe=instance)
+        }
+        old_amounts = Counter(
+            {ingredient_id: row.amount
+             for ingredient_id, row in existing.items()})
+        new_amounts = Counter(
+            {ingred['id'].id: ingred['amount'] for ingred in ingredients_data})
+        to_create, to_update = [], []
+        for ingredient_id, amount in new_amounts.items():
+            row = existing.get(ingredient_id)
+            if row is None:
+                to_create.append(RecipeIngredient(
+                    recipe=instance,
+                    ingredient_id=ingredient_id,
+                    amount=amount))
+            elif row.amount != amount:
+                row.amount = amount
+                to_update.append(row)
+        to_delete = [row.pk for ingredient_id, row in existing.items()
+                     if ingredient_id not in new_amounts]
+        if not (to_create or to_update or to_delete):
+            return
+        # Удаление через QuerySet отправляет post_delete, и удаленные
+        # строки убираются из списков покупок сигналом. Массовые
+        # изменение и создание сигналов не отправляют.
+        RecipeIngredient.objects.filter(pk__in=to_delete).delete()
+        RecipeIngredient.objects.bulk_update(to_update, ('amount',))
+        RecipeIngredient.objects.bulk_create(to_create)
+        old_amounts = Counter(
+            {ingredient_id: amount
+             for ingredient_id, amount in old_amounts.items()
+             if ingredient_id in new_amounts})
+        apply_recipe_change(instance.id, old_amounts, new_amounts)
+        # Массовые операции не отправляют сигналы, поэтому версия
+        # данных рецептов сбрасывается здесь, после фиксации изменений.
+        transaction.on_commit(lambda: bump_version(RECIPE_DATA_VERSION))
+
+    @transaction.atomic
     def update(self, instance, validated_data):
         """Обновление рецепта."""
         if 'ingredients' in validated_data:
-            ingredients = validated_data.pop('ingredients')
-            instance.ingredients.clear()
-            self.create_ingredients(ingredients, instance)
+            self.update_ingredients(
+                instance, validated_data.pop('ingredients'))
         if 'tags' in validated_data:
             tags_data = validated_data.pop('tags')
             instance.tags.set(tags_data)
-        return super().update(
-            instance, validated_data)
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        # Сохраняются только переданные поля, чтобы не перезаписать
+        # счетчики, которые меняются отдельно через F-выражения.
+        # Отметка изменения обновляется всегда: ингредиенты и теги
+        # меняются массовыми операциями без сигналов.
+        instance.save(update_fields=[*validated_data, 'updated'])
+        return instance
 
     def to_representation(self, instance):
         """Добавление полей с ингредиентами."""
@@ -0,0 +1,203 @@
+import csv
+import json
+import zlib
+
+from django.conf import settings
+from django.db.models import F, Sum
+from PIL import Image, ImageDraw, ImageFont
+
+from recipes.models import RecipeIngredient, ShoppingCart, ShoppingListItem
+
+ROWS_CHUNK_SIZE = 2000
+CSV_HEADER = ('name', 'measurement_unit', 'amount')
+PDF_TITLE = 'Список покупок'
+PDF_PAGE_POINTS = (595.28, 841.89)
+PDF_PAGE_PIXELS = (827, 1169)
+PDF_MARGIN = 60
+PDF_FONT_SIZE = 18
+PDF_LINE_HEIGHT = 26
+
+
+def shopping_list_queryset(user):
+    """Итоги списка покупок пользователя из ShoppingListItem.
+        Если сохраненных строк нет, а корзина не пуста (например, сразу
+        после loaddata, до rebuild_shopping_lists), итоги считаются
+        по корзине."""
+    items = ShoppingListItem.objects.filter(user=user)
+    if items.exists() or not ShoppingCart.objects.filter(user=user).exists():
+        return items.values(
+            'ingredient_id', 'total',
+            name=F('ingredient__name'),
+            units=F('ingredient__measurement_unit'),
+        )
+    return RecipeIngredient.objects.filter(
+        recipe__shopping_cart_recipe__user=user,
+    ).values(
+        'ingredient_id',
+        name=F('ingredient__name'),
+        units=F('ingredient__measurement_unit'),
+    ).annotate(total=Sum('amount'))
+
+
+def shopping_list_rows(user):
+    """Суммарное количество ингредиентов из корзины пользователя.
+        Строки читаются курсором на стороне сервера порциями."""
+    return shopping_list_queryset(user).order_by(
+        '-total', 'name').iterator(chunk_size=ROWS_CHUNK_SIZE)
+
+
+def format_row(row):
+    return f"{row['name']} {row['units']} - {row['total']}"
+
+
+def render_txt(rows):
+    separator = ''
+    for row in rows:
+        yield f'{separator}{format_row(row)}'
+        separator = '\n'
+
+
+class Echo:
+    """Файлоподобный объект, возвращающий записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def render_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_HEADER)
+    for row in rows:
+        yield writer.writerow((row['name'], row['units'], row['total']))
+
+
+def render_json(rows):
+    separator = ''
+    yield '['
+    for row in rows:
+        item = {'name': row['name'], 'measurement_unit': row['units'],
+                'amount': row['total']}
+        yield separator + json.dumps(item, ensure_ascii=False)
+        separator = ', '
+    yield ']'
+
+
+class StreamingPDFWriter:
+    """Минимальный генератор PDF, выдающий документ по страницам.
+        Каждая страница растеризуется Pillow шрифтом SHOPPING_LIST_FONT,
+        поэтому кириллица не требует встраивания шрифта в PDF.
+        В памяти держится только текущая страница и таблица смещений."""
+
+    CATALOG_ID = 1
+    PAGES_ID = 2
+
+    def __init__(self):
+        self.offset = 0
+        self.offsets = {}
+        self.page_ids = []
+        self.next_id = self.PAGES_ID + 1
+
+    def emit(self, data):
+        self.offset += len(data)
+        return data
+
+    def emit_object(self, object_id, body, stream=None):
+        self.offsets[object_id] = self.offset
+        data = f'{object_id} 0 obj\n'.encode() + body
+        if stream is not None:
+            data += b'\nstream\n' + stream + b'\nendstream'
+        return self.emit(data + b'\nendobj\n')
+
+    def allocate_ids(self, count):
+        ids = range(self.next_id, self.next_id + count)
+        self.next_id += count
+        return ids
+
+    def header(self):
+        return self.emit(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n') + self.emit_object(
+            self.CATALOG_ID,
+            f'<< /Type /Catalog /Pages {self.PAGES_ID} 0 R >>'.encode())
+
+    def page(self, image):
+        image_id, content_id, page_id = self.allocate_ids(3)
+        self.page_ids.append(page_id)
+        width, height = PDF_PAGE_POINTS
+        pixels = zlib.compress(image.tobytes())
+        content = f'q {width} 0 0 {height} 0 0 cm /Im0 Do Q'.encode()
+        return b''.join((
+            self.emit_object(image_id, (
+                f'<< /Type /XObject /Subtype /Image '
+                f'/Width {image.width} /Height {image.height} '
+                f'/ColorSpace /DeviceGray /BitsPerComponent 8 '
+                f'/Filter /FlateDecode /Length {len(pixels)} >>'
+            ).encode(), pixels),
+            self.emit_object(
+                content_id,
+                f'<< /Length {len(content)} >>'.encode(), content),
+            self.emit_object(page_id, (
+                f'<< /Type /Page /Parent {self.PAGES_ID} 0 R '
+                f'/MediaBox [0 0 {width} {height}] '
+                f'/Resources << /XObject << /Im0 {image_id} 0 R >> >> '
+                f'/Contents {content_id} 0 R >>'
+            ).encode()),
+        ))
+
+    def trailer(self):
+        kids = ' '.join(f'{page_id} 0 R' for page_id in self.page_ids)
+        data = self.emit_object(self.PAGES_ID, (
+            f'<< /Type /Pages /Kids [{kids}] '
+            f'/Count {len(self.page_ids)} >>'
+        ).encode())
+        xref_offset = self.offset
+        lines = [f'xref\n0 {self.next_id}\n', '0000000000 65535 f \n']
+        lines.extend(
+            f'{self.offsets[object_id]:010d} 00000 n \n'
+            for object_id in range(1, self.next_id))
+        lines.append(
+            f'trailer\n<< /Size {self.next_id} '
+            f'/Root {self.CATALOG_ID} 0 R >>\n'
+            f'startxref\n{xref_offset}\n%%EOF\n')
+        return data + ''.join(lines).encode()
+
+
+def load_pdf_font():
+    """Шрифт с кириллицей для pdf. Встроенный шрифт Pillow содержит
+        только Latin-1, поэтому без файла SHOPPING_LIST_FONT
+        выбрасывается OSError до начала выгрузки."""
+    return ImageFont.truetype(settings.SHOPPING_LIST_FONT, PDF_FONT_SIZE)
+
+
+def render_pdf(rows, font):
+    """Страницы pdf растрируются в картинки: текст в файле
+        не выделяется и не ищется."""
+    writer = StreamingPDFWriter()
+    lines_per_page = (
+        PDF_PAGE_PIXELS[1] - 2 * PDF_MARGIN) // PDF_LINE_HEIGHT
+    yield writer.header()
+    lines = [PDF_TITLE, '']
+    for row in rows:
+        lines.append(format_row(row))
+        if len(lines) == lines_per_page:
+            yield writer.page(draw_page(lines, font))
+            lines = []
+    if lines or not writer.page_ids:
+        yield writer.page(draw_page(lines, font))
+    yield writer.trailer()
+
+
+def draw_page(lines, font):
+    image = Image.new('L', PDF_PAGE_PIXELS, 255)
+    draw = ImageDraw.Draw(image)
+    for number, line in enumerate(lines):
+        draw.text(
+            (PDF_MARGIN, PDF_MARGIN + number * PDF_LINE_HEIGHT),
+            line, fill=0, font=font)
+    return image
+
+
+RENDERERS = {
+    'txt': (render_txt, 'text/plain; charset=utf-8'),
+    'csv': (render_csv, 'text/csv; charset=utf-8'),
+    'json': (render_json, 'application/json; charset=utf-8'),
+    'pdf': (render_pdf, 'application/pdf'),
+}
@@ -1,31 +1,55 @@
-from django.db.models import F, Sum
-from django.http import HttpResponse
+from collections import OrderedDict
+from functools import partial
+
+from django.db.models import Exists, OuterRef, Prefetch, Subquery, Value
+from django.db.models.fields import BooleanField
+from django.db import IntegrityError, transaction
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser
 from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 
-from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingCart, Tag)
+from recipes.aggregates import (add_recipes_to_shopping_list, change_counters,
+                                lock_users,
+                                remove_recipes_from_shopping_list)
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from recipes.signals import relation_receivers_disabled
+from recipes.versions import (INGREDIENTS_VERSION, RECIPE_COUNTS_VERSION,
+                              RECIPE_DATA_VERSION, TAGS_VERSION, bump_version,
+                              user_version_name)
 from users.models import Subscribtion, User
 from .filters import RecipeFilter
-from .pagination import CustomPageNumberPagination
+from .indexes import ingredient_index
+from .mixins import AnonymousResponseCacheMixin, ConditionalGetMixin
+from .pagination import OptionalCursorPagination
+from .parsers import RecipeMultiPartParser
 from .permissions import AuthorOrReadOnly
+from .renderers import (ShoppingListCSVRenderer, ShoppingListPDFRenderer,
+                        ShoppingListTextRenderer)
+from .search import rank_queryset, rank_rows, uses_trigram_index
 from .serializers import (IngredientListSerializer,
                           RecipeCreateUpdateSerializer,
                           RecipeFavoriteAndCartSerializer,
-                          RecipeLiteSerializer, SubscriptionSerializer,
-                          TagSerializer)
+                          RecipeIdsSerializer, RecipeLiteSerializer,
+                          ShoppingListItemSerializer,
+                          SubscriptionSerializer, TagSerializer,
+                          recipe_prefetch_lookups)
+from .shopping_list import (RENDERERS, load_pdf_font,
+                            shopping_list_queryset, shopping_list_rows)
 
 
 class CustomUserViewSet(UserViewSet):
     """ViewSet для работы с пользователями."""
 
     http_method_names = ['get', 'post', 'delete']
-    pagination_class = CustomPageNumberPagination
+    pagination_class = OptionalCursorPagination
+    cursor_ordering = ('id',)
 
     def get_permissions(self):
         if self.action in ['subscibe', 'subscriptions']:
@@ -57,7 +81,8 @@ class CustomUserViewSet(UserViewSet):
                 data=request.data, context={"request": request,
                                             "author": author})
             serializer.is_valid(raise_exception=True)
-            serializer.save(author=author, user=user)
+            with transaction.atomic():
+                serializer.save(author=author, user=user)
             return Response(serializer.data,
                             status=status.HTTP_201_CREATED)
         if request.method == "DELETE":
@@ -65,14 +90,33 @@ class CustomUserViewSet(UserViewSet):
                 return Response(
                     {'errors': 'Нельзя отписаться повторно'},
                     status=status.HTTP_400_BAD_REQUEST)
-            subscription.delete()
+            with transaction.atomic():
+                subscription.delete()
             return Response(status=status.HTTP_204_NO_CONTENT)
 
+    def get_author_recipes_prefetch(self):
+        """Prefetch рецептов автора с учетом recipes_limit:
+            первые N рецептов каждого автора выбираются одним запросом."""
+        limit = self.request.query_params.get('recipes_limit')
+        recipes = Recipe.objects.order_by('-pub_date', '-id')
+        if limit and limit.isdigit():
+            recipes = recipes.filter(pk__in=Subquery(
+                Recipe.objects.filter(
+                    author=OuterRef('author')
+                ).order_by('-pub_date', '-id').values('pk')[:int(limit)]
+            ))
+        return Prefetch(
+            'author__recipes', queryset=recipes, to_attr='limited_recipes')
+
     @action(methods=['get'], detail=False)
     def subscriptions(self, request):
         """Возвращает пользователей, на которых
             подписан текущий пользователь."""
-        subscriptions = Subscribtion.objects.filter(user=self.request.user)
+        subscriptions = Subscribtion.objects.filter(
+            user=self.request.user
+        ).select_related('author').prefetch_related(
+            self.get_author_recipes_prefetch()
+        ).order_by('id')
         pages = self.paginate_queryset(subscriptions)
         serializer = SubscriptionSerializer(
             pages,
@@ -81,15 +125,43 @@ class CustomUserViewSet(UserViewSet):
         return self.get_paginated_response(serializer.data)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(AnonymousResponseCacheMixin, viewsets.ModelViewSet):
     """ViewSet для работы с рецептами."""
 
     queryset = Recipe.objects.all()
     filter_backends = (DjangoFilterBackend,)
     filter_class = RecipeFilter
     permission_classes = (AuthorOrReadOnly,)
-    pagination_class = CustomPageNumberPagination
+    parser_classes = (JSONParser, RecipeMultiPartParser)
+    pagination_class = OptionalCursorPagination
+    cursor_ordering = ('-pub_date', '-id')
+    # Результаты поиска упорядочены по рангу, а не по cursor_ordering.
+    cursor_excluded_params = ('search',)
+    count_cache_version = RECIPE_COUNTS_VERSION
+    response_cache_version = RECIPE_DATA_VERSION
+
+    def get_queryset(self):
+        """Рецепты с автором, а также признаками избранного и корзины,
+            вычисленными одним запросом на всю страницу.
+            Теги и ингредиенты для списка загружаются сериализатором
+            только для рецептов, которых нет в кеше фрагментов."""
+        queryset = super().get_queryset().select_related('author')
+        if self.action != 'list':
+            queryset = queryset.prefetch_related(*recipe_prefetch_lookups())
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset.annotate(
+                is_favorited=Value(False, output_field=BooleanField()),
+                is_in_shopping_cart=Value(False, output_field=BooleanField()),
+            )
+        return queryset.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+        )
 
+    @transaction.atomic
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
@@ -99,30 +171,100 @@ class RecipeViewSet(viewsets.ModelViewSet):
         else:
             return RecipeCreateUpdateSerializer
 
+    @staticmethod
+    def lock_user_lists(user):
+        """Блокировка строки пользователя до конца транзакции.
+            Одиночные и массовые изменения его списков выполняются
+            по очереди, поэтому массовые операции видят актуальные
+            записи и не учитывают изменения дважды."""
+        lock_users([user.pk])
+
+    @transaction.atomic
     def delete_relation(self, model, user, pk, name):
-        """"Удаление рецепта из списка пользователя."""
-        recipe = get_object_or_404(Recipe, pk=pk)
-        relation = model.objects.filter(user=user, recipe=recipe)
-        if not relation.exists():
+        """"Удаление рецепта из списка пользователя.
+            Счетчик рецепта уменьшается сигналом post_delete."""
+        self.lock_user_lists(user)
+        deleted, _ = model.objects.filter(user=user, recipe_id=pk).delete()
+        if not deleted:
+            get_object_or_404(Recipe, pk=pk)
             return Response(
                 {'errors': f'Нельзя повторно удалить рецепт из {name}'},
                 status=status.HTTP_400_BAD_REQUEST)
-        relation.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @transaction.atomic
     def add(self, model, user, pk, name):
-        """Добавление рецепта в список пользователя."""
-        recipe = get_object_or_404(Recipe, pk=pk)
-        relation = model.objects.filter(user=user, recipe=recipe)
-        if relation.exists():
+        """Добавление рецепта в список пользователя. Повторное добавление
+            определяется по уникальному ограничению, а не отдельным
+            запросом, поэтому одновременные запросы не приводят к ошибке.
+            Счетчик рецепта увеличивается сигналом post_save. Ошибки
+            целостности из приемников сигналов ответом 400 не считаются."""
+        serializer = RecipeLiteSerializer(data=self.request.data)
+        serializer.is_valid(raise_exception=True)
+        get_object_or_404(Recipe, pk=pk)
+        self.lock_user_lists(user)
+        try:
+            with transaction.atomic():
+                model.objects.create(user=user, recipe_id=pk)
+        except IntegrityError:
+            if not model.objects.filter(user=user, recipe_id=pk).exists():
+                raise
+            transaction.set_rollback(True)
             return Response(
                 {'errors': f'Нельзя повторно добавить рецепт в {name}'},
                 status=status.HTTP_400_BAD_REQUEST)
-        serializer = RecipeLiteSerializer(data=self.request.data)
-        serializer.is_valid(raise_exception=True)
-        model.objects.create(user=user, recipe=recipe)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    def change_relations(self, model, request, counter,
+                         on_add=None, on_remove=None):
+        """Массовое добавление (POST) или удаление (DELETE) рецептов
+            из списка пользователя одним запросом на запись.
+            Возвращает результат по каждому переданному id."""
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = list(OrderedDict.fromkeys(
+            serializer.validated_data['recipes']))
+        user = request.user
+        with transaction.atomic():
+            self.lock_user_lists(user)
+            found = set(Recipe.objects.filter(
+                pk__in=recipe_ids).values_list('pk', flat=True))
+            linked = set(model.objects.filter(
+                user=user, recipe_id__in=recipe_ids
+            ).values_list('recipe_id', flat=True))
+            if request.method == 'POST':
+                changed = [pk for pk in recipe_ids
+                           if pk in found and pk not in linked]
+                model.objects.bulk_create(
+                    [model(user=user, recipe_id=pk) for pk in changed],
+                    ignore_conflicts=True)
+                done, skipped = 'added', 'exists'
+                delta, on_change = 1, on_add
+            else:
+                changed = [pk for pk in recipe_ids if pk in linked]
+                with relation_receivers_disabled():
+                    model.objects.filter(
+                        user=user, recipe_id__in=changed).delete()
+                done, skipped = 'removed', 'absent'
+                delta, on_change = -1, on_remove
+            if changed:
+                # bulk_create не отправляет сигналы, а приемники удаления
+                # отключены, поэтому счетчики, списки покупок и версия
+                # меняются здесь одним запросом на все рецепты.
+                change_counters(
+                    Recipe.objects.filter(pk__in=changed), **{counter: delta})
+                if on_change is not None:
+                    on_change(user.id, changed)
+                transaction.on_commit(lambda: bump_version(
+                    user_version_name(RECIPE_COUNTS_VERSION, user.id)))
+        changed = set(changed)
+        return Response({'recipes': [
+            {'id': pk,
+             'status': (done if pk in changed
+                        else skipped if pk in found else 'not_found')}
+            for pk in recipe_ids
+        ]})
+
     @action(methods=['post', 'delete'], detail=True)
     def favorite(self, request, pk=None):
         """Избранное: добавление и удаление рецептов."""
@@ -147,36 +289,64 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return self.delete_relation(ShoppingCart, user, pk, name)
         return Response(status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
+    @action(methods=['post', 'delete'], detail=False,
+            url_path='favorite', url_name='favorite-bulk')
+    def favorite_bulk(self, request):
+        """Избранное: массовое добавление и удаление рецептов."""
+        return self.change_relations(Favorite, request, 'favorites_count')
+
+    @action(methods=['post', 'delete'], detail=False,
+            url_path='shopping_cart', url_name='shopping-cart-bulk')
+    def shopping_cart_bulk(self, request):
+        """Список покупок: массовое добавление и удаление рецептов."""
+        return self.change_relations(
+            ShoppingCart, request, 'shopping_carts_count',
+            on_add=add_recipes_to_shopping_list,
+            on_remove=remove_recipes_from_shopping_list)
+
     @action(methods=['get'], detail=False,
             permission_classes=(IsAuthenticated,))
+    def shopping_cart_summary(self, request):
+        """Сводный список покупок: итог по каждому ингредиенту."""
+        items = shopping_list_queryset(request.user).order_by('-total', 'name')
+        serializer = ShoppingListItemSerializer(items, many=True)
+        return Response(serializer.data)
+
+    @action(methods=['get'], detail=False,
+            permission_classes=(IsAuthenticated,),
+            renderer_classes=(ShoppingListTextRenderer, JSONRenderer,
+                              ShoppingListCSVRenderer,
+                              ShoppingListPDFRenderer))
     def download_shopping_cart(self, request):
-        """Cкачать список покупок."""
-        items = RecipeIngredient.objects.select_related(
-            'recipe', 'ingredient')
-        items = items.filter(
-            recipe__shopping_cart_recipe__user=request.user,)
-        items = items.values('ingredient__name', 'ingredient__measurement_unit'
-                             ).annotate(
-            name=F('ingredient__name'),
-            units=F('ingredient__measurement_unit'),
-            total=Sum('amount'),
-        ).order_by('-total')
-        text = '\n'.join([
-            f"{item['name']} {item['units']} - {item['total']}"
-            for item in items
-        ])
-        filename = "foodgram_shopping_cart.txt"
-        response = HttpResponse(text, content_type='text/plain')
+        """Cкачать список покупок в формате txt, csv, json или pdf.
+            Файл формируется и отдается потоком. Шрифт для pdf
+            загружается заранее, чтобы ошибка не оборвала поток."""
+        file_format = request.accepted_renderer.format
+        render, content_type = RENDERERS[file_format]
+        if file_format == 'pdf':
+            try:
+                render = partial(render, font=load_pdf_font())
+            except OSError:
+                return Response(
+                    {'errors': 'Список покупок в pdf недоступен: '
+                               'не найден шрифт SHOPPING_LIST_FONT'},
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    content_type='application/json')
+        response = StreamingHttpResponse(
+            render(shopping_list_rows(request.user)),
+            content_type=content_type)
+        filename = f'foodgram_shopping_cart.{file_format}'
         response['Content-Disposition'] = f'attachment; filename={filename}'
         return response
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class IngredientViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """ViewSet для работы с ингредиентами."""
 
     serializer_class = IngredientListSerializer
     pagination_class = None
     http_method_names = ['get']
+    etag_version = INGREDIENTS_VERSION
 
     def get_queryset(self):
         queryset = Ingredient.objects
@@ -185,11 +355,36 @@ class IngredientViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(name__istartswith=name)
         return queryset.all()
 
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            self.list_ingredients, request, *args, **kwargs)
+
+    def list_ingredients(self, request, *args, **kwargs):
+        """Поиск ингредиентов по началу названия через индекс в памяти
+            или ранжированный нечеткий поиск по параметру search.
+            Параметр limit ограничивает количество результатов."""
+        limit = request.query_params.get('limit')
+        limit = int(limit) if limit and limit.isdigit() else None
+        search = request.query_params.get('search')
+        if search:
+            return Response(self.search(search, limit))
+        return Response(ingredient_index.search(
+            request.query_params.get('name', ''), limit=limit))
+
+    def search(self, query, limit=None):
+        """Совпадения по началу названия, затем по подстроке,
+            затем по сходству триграмм."""
+        if uses_trigram_index():
+            return list(rank_queryset(Ingredient.objects.all(), query).values(
+                'id', 'name', 'measurement_unit')[:limit])
+        return rank_rows(ingredient_index.rows(), query, limit=limit)
+
 
-class TagViewSet(viewsets.ModelViewSet):
+class TagViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """ViewSet для работы с тэгами."""
 
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
     http_method_names = ['get']
+    etag_version = TAGS_VERSION
@@ -1,38 +1,49 @@
 from django.contrib import admin
 
 from .models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                     ShoppingCart, Tag)
+                     ShoppingCart, ShoppingListItem, Tag)
 
 
 class RecipeIngredientInline(admin.TabularInline):
     model = RecipeIngredient
     min_num = 1
     extra = 0
+    autocomplete_fields = ('ingredient',)
 
 
 class RecipeIngredientAdmin(admin.ModelAdmin):
+    list_display = ('id', 'recipe', 'ingredient', 'amount')
+    list_select_related = ('recipe__author', 'ingredient')
     fields = ('ingredient', 'recipe', 'amount')
-    search_fields = ('ingredient', 'recipe')
+    autocomplete_fields = ('ingredient', 'recipe')
+    search_fields = ('ingredient__name', 'recipe__name')
+    show_full_result_count = False
 
 
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name', 'author', 'added_to_favorite_count')
-    readonly_fields = ('added_to_favorite_count',)
-    search_fields = ('name',)
-    list_filter = ('author', 'name', 'tags',)
+    list_display = ('id', 'name', 'author', 'added_to_favorite_count',
+                    'shopping_carts_count')
+    list_select_related = ('author',)
+    readonly_fields = ('added_to_favorite_count', 'shopping_carts_count')
+    search_fields = ('name', 'author__username')
+    list_filter = ('tags',)
     filter_horizontal = ('tags',)
+    raw_id_fields = ('author',)
     inlines = (RecipeIngredientInline,)
     empty_value_display = '-empty-'
+    show_full_result_count = False
 
     def added_to_favorite_count(self, obj):
-        return Favorite.objects.filter(recipe=obj).count()
+        return obj.favorites_count
 
     added_to_favorite_count.short_description = 'Добавлений в избранное'
+    added_to_favorite_count.admin_order_field = 'favorites_count'
 
 
 class IngredientAdmin(admin.ModelAdmin):
     list_display = ('name', 'measurement_unit',)
-    list_filter = ('name',)
+    list_filter = ('measurement_unit',)
+    search_fields = ('name',)
     empty_value_display = '-empty-'
 
 
@@ -41,9 +52,28 @@ class TagAdmin(admin.ModelAdmin):
     empty_value_display = '-empty-'
 
 
+class UserRecipeAdmin(admin.ModelAdmin):
+    """Общие настройки для связей пользователь - рецепт."""
+
+    list_display = ('id', 'user', 'recipe')
+    list_select_related = ('user', 'recipe__author')
+    autocomplete_fields = ('user', 'recipe')
+    search_fields = ('user__username', 'recipe__name')
+    show_full_result_count = False
+
+
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'ingredient', 'total')
+    list_select_related = ('user', 'ingredient')
+    readonly_fields = ('user', 'ingredient', 'total')
+    search_fields = ('user__username', 'ingredient__name')
+    show_full_result_count = False
+
+
 admin.site.register(Recipe, RecipeAdmin)
 admin.site.register(Ingredient, IngredientAdmin)
 admin.site.register(Tag, TagAdmin)
-admin.site.register(ShoppingCart)
-admin.site.register(Favorite)
+admin.site.register(ShoppingCart, UserRecipeAdmin)
+admin.site.register(Favorite, UserRecipeAdmin)
 admin.site.register(RecipeIngredient, RecipeIngredientAdmin)
+admin.site.register(ShoppingListItem, ShoppingListItemAdmin)
@@ -0,0 +1,189 @@
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Greatest
+
+from users.models import Subscribtion, User
+from .models import (Favorite, Recipe, RecipeIngredient, ShoppingCart,
+                     ShoppingListItem)
+
+
+def recipe_amounts(recipe_id):
+    """Количество каждого ингредиента в рецепте."""
+    return Counter(dict(RecipeIngredient.objects.filter(
+        recipe_id=recipe_id).values_list('ingredient_id', 'amount')))
+
+
+def lock_users(user_ids):
+    """Блокировка строк пользователей до конца транзакции в порядке pk,
+        чтобы одновременные блокировки нескольких строк не приводили
+        к взаимной блокировке."""
+    return list(User.objects.select_for_update().filter(
+        pk__in=user_ids).order_by('pk').values_list('pk', flat=True))
+
+
+@transaction.atomic
+def apply_shopping_list_deltas(user_ids, deltas):
+    """Применение приращений {ingredient_id: delta} к спискам покупок
+        пользователей. Строки с нулевым итогом удаляются.
+        Строки пользователей блокируются так же, как при изменении
+        их корзин, поэтому две транзакции не создают одну и ту же
+        строку списка одновременно."""
+    deltas = {key: value for key, value in deltas.items() if value}
+    user_ids = list(user_ids)
+    if not deltas or not user_ids:
+        return
+    lock_users(user_ids)
+    existing = {
+        (item.user_id, item.ingredient_id): item
+        for item in ShoppingListItem.objects.select_for_update().filter(
+            user_id__in=user_ids, ingredient_id__in=deltas)
+    }
+    to_create, to_update, to_delete = [], [], []
+    for user_id in user_ids:
+        for ingredient_id, delta in deltas.items():
+            item = existing.get((user_id, ingredient_id))
+            if item is None:
+                if delta > 0:
+                    to_create.append(ShoppingListItem(
+                        user_id=user_id, ingredient_id=ingredient_id,
+                        total=delta))
+                continue
+            item.total += delta
+            if item.total > 0:
+                to_update.append(item)
+            else:
+                to_delete.append(item.pk)
+    ShoppingListItem.objects.bulk_create(to_create)
+    ShoppingListItem.objects.bulk_update(to_update, ('total',))
+    ShoppingListItem.objects.filter(pk__in=to_delete).delete()
+
+
+def recipes_amounts(recipe_ids):
+    """Суммарное количество каждого ингредиента в нескольких рецептах."""
+    return Counter(dict(RecipeIngredient.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values('ingredient_id').annotate(
+        total=Sum('amount')).values_list('ingredient_id', 'total').order_by()))
+
+
+def add_recipes_to_shopping_list(user_id, recipe_ids):
+    apply_shopping_list_deltas([user_id], recipes_amounts(recipe_ids))
+
+
+def remove_recipes_from_shopping_list(user_id, recipe_ids):
+    amounts = recipes_amounts(recipe_ids)
+    apply_shopping_list_deltas(
+        [user_id], {key: -value for key, value in amounts.items()})
+
+
+def add_recipe_to_shopping_list(user_id, recipe_id):
+    apply_shopping_list_deltas([user_id], recipe_amounts(recipe_id))
+
+
+def remove_recipe_from_shopping_list(user_id, recipe_id):
+    amounts = recipe_amounts(recipe_id)
+    apply_shopping_list_deltas(
+        [user_id], {key: -value for key, value in amounts.items()})
+
+
+def apply_recipe_change(recipe_id, old_amounts, new_amounts):
+    """Перенос изменения ингредиентов рецепта в списки покупок
+        всех пользователей, у которых рецепт в корзине."""
+    deltas = Counter(new_amounts)
+    deltas.subtract(old_amounts)
+    apply_shopping_list_deltas(
+        ShoppingCart.objects.filter(
+            recipe_id=recipe_id).values_list('user_id', flat=True),
+        deltas)
+
+
+def computed_shopping_lists(user_ids=None):
+    """Списки покупок, вычисленные заново по корзинам:
+        {user_id: {ingredient_id: total}}."""
+    rows = RecipeIngredient.objects.filter(
+        recipe__shopping_cart_recipe__isnull=False)
+    if user_ids is not None:
+        rows = rows.filter(recipe__shopping_cart_recipe__user__in=user_ids)
+    rows = rows.values(
+        'recipe__shopping_cart_recipe__user', 'ingredient'
+    ).annotate(total=Sum('amount')).order_by()
+    result = defaultdict(dict)
+    for row in rows.iterator():
+        result[row['recipe__shopping_cart_recipe__user']][
+            row['ingredient']] = row['total']
+    return result
+
+
+def stored_shopping_lists(user_ids=None):
+    """Списки покупок из таблицы ShoppingListItem."""
+    items = ShoppingListItem.objects.all()
+    if user_ids is not None:
+        items = items.filter(user__in=user_ids)
+    result = defaultdict(dict)
+    for user_id, ingredient_id, total in items.values_list(
+            'user', 'ingredient', 'total').iterator():
+        result[user_id][ingredient_id] = total
+    return result
+
+
+@transaction.atomic
+def rebuild_shopping_lists(user_ids=None):
+    """Полный пересчет списков покупок."""
+    items = ShoppingListItem.objects.all()
+    if user_ids is not None:
+        items = items.filter(user__in=user_ids)
+    items.delete()
+    ShoppingListItem.objects.bulk_create(
+        ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id,
+                         total=total)
+        for user_id, totals in computed_shopping_lists(user_ids).items()
+        for ingredient_id, total in totals.items()
+    )
+
+
+def change_counters(queryset, **deltas):
+    """Атомарное изменение счетчиков через F-выражения.
+        Уменьшение не опускает счетчик ниже нуля, даже если он уже
+        разошелся с данными. Возвращает количество измененных строк."""
+    return queryset.update(**{
+        field: F(field) + delta if delta >= 0
+        else Greatest(F(field) + delta, 0)
+        for field, delta in deltas.items()})
+
+
+def counter_expression(related_model, field):
+    """Фактическое количество связанных записей для строки."""
+    return Coalesce(Subquery(
+        related_model.objects.filter(
+            **{field: OuterRef('pk')}
+        ).order_by().values(field).annotate(
+            count=Count('pk')).values('count')
+    ), 0)
+
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'shopping_carts_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Subscribtion, 'author'),
+    (User, 'following_count', Subscribtion, 'user'),
+)
+
+
+@transaction.atomic
+def reconcile_counters(dry_run=False):
+    """Исправление расхождений денормализованных счетчиков.
+        Возвращает количество исправленных строк по каждому счетчику."""
+    result = {}
+    for model, counter, related_model, field in COUNTERS:
+        expression = counter_expression(related_model, field)
+        drifted = list(model.objects.annotate(
+            actual=expression
+        ).exclude(**{counter: F('actual')}).values_list('pk', flat=True))
+        if drifted and not dry_run:
+            model.objects.filter(pk__in=drifted).update(
+                **{counter: expression})
+        result[f'{model.__name__}.{counter}'] = len(drifted)
+    return result
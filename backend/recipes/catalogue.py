@@ -0,0 +1,151 @@
+import csv
+import io
+import json
+import os
+import re
+from collections import Counter
+from itertools import islice
+
+from django.db import connection, transaction
+
+from .models import Ingredient
+from .versions import INGREDIENTS_VERSION, bump_version
+
+FORMATS = ('csv', 'json', 'jsonl')
+JSON_CHUNK_SIZE = 64 * 1024
+JSON_SEPARATORS = re.compile(r'[\s,]*')
+
+
+def iter_json_array(file, chunk_size=JSON_CHUNK_SIZE):
+    """Элементы JSON-массива по одному, без чтения файла целиком."""
+    decoder = json.JSONDecoder()
+    buffer, position = '', 0
+    started = eof = False
+    while True:
+        position = JSON_SEPARATORS.match(buffer, position).end()
+        if position < len(buffer):
+            if not started:
+                if buffer[position] != '[':
+                    raise ValueError('Ожидается JSON-массив.')
+                started = True
+                position += 1
+                continue
+            if buffer[position] == ']':
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except ValueError:
+                if eof:
+                    raise
+            else:
+                yield item
+                continue
+        elif eof:
+            raise ValueError('Неожиданный конец JSON-файла.')
+        chunk = file.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+def read_ingredients(path, file_format=None):
+    """Пары (название, единица измерения) из файла csv, json или jsonl."""
+    file_format = file_format or os.path.splitext(path)[1][1:].lower()
+    if file_format not in FORMATS:
+        raise ValueError(f'Неизвестный формат файла: {file_format}')
+    with open(path, encoding='utf-8', newline='') as file:
+        if file_format == 'csv':
+            for row in csv.reader(file):
+                yield tuple(row[:2]) if len(row) >= 2 else ('', '')
+            return
+        if file_format == 'json':
+            items = iter_json_array(file)
+        else:
+            items = (json.loads(line) for line in file if line.strip())
+        for item in items:
+            yield item.get('name', ''), item.get('measurement_unit', '')
+
+
+def clean_ingredients(rows, stats):
+    """Строки без пробелов по краям; пустые и слишком длинные
+        значения пропускаются и учитываются как ошибочные."""
+    name_length = Ingredient._meta.get_field('name').max_length
+    unit_length = Ingredient._meta.get_field('measurement_unit').max_length
+    for name, unit in rows:
+        name, unit = name.strip(), unit.strip()
+        if (not name or not unit or len(name) > name_length
+                or len(unit) > unit_length):
+            stats['invalid'] += 1
+            continue
+        yield name, unit
+
+
+def batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def bulk_create_ingredients(rows, batch_size):
+    """Загрузка пачками через bulk_create: в каждой пачке отсеиваются
+        ингредиенты, которые уже есть в базе."""
+    stats = Counter()
+    for batch in batches(rows, batch_size):
+        keys = set(batch)
+        existing = set(Ingredient.objects.filter(
+            name__in={name for name, _ in keys}
+        ).values_list('name', 'measurement_unit'))
+        new = sorted(keys - existing)
+        Ingredient.objects.bulk_create(
+            (Ingredient(name=name, measurement_unit=unit)
+             for name, unit in new),
+            ignore_conflicts=True)
+        stats['inserted'] += len(new)
+        stats['skipped'] += len(batch) - len(new)
+    return stats
+
+
+def copy_ingredients(rows, batch_size):
+    """Загрузка через COPY во временную таблицу и одну вставку
+        с пропуском конфликтов по unique_for_ingredient (PostgreSQL)."""
+    stats = Counter()
+    table = connection.ops.quote_name(Ingredient._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'CREATE TEMPORARY TABLE ingredient_load '
+            '(name text, measurement_unit text) ON COMMIT DROP')
+        for batch in batches(rows, batch_size):
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(batch)
+            buffer.seek(0)
+            cursor.copy_expert(
+                'COPY ingredient_load (name, measurement_unit) '
+                'FROM STDIN WITH (FORMAT csv)', buffer)
+            stats['skipped'] += len(batch)
+        cursor.execute(
+            f'INSERT INTO {table} (name, measurement_unit) '
+            'SELECT name, measurement_unit FROM ingredient_load '
+            'ON CONFLICT ON CONSTRAINT unique_for_ingredient DO NOTHING')
+        stats['inserted'] = cursor.rowcount
+        stats['skipped'] -= cursor.rowcount
+    return stats
+
+
+@transaction.atomic
+def load_ingredients(path, file_format=None, batch_size=1000,
+                     use_copy=None):
+    """Загрузка каталога ингредиентов из файла.
+        Возвращает количество добавленных, пропущенных (уже есть в базе
+        или повторяются в файле) и ошибочных строк."""
+    if use_copy is None:
+        use_copy = connection.vendor == 'postgresql'
+    stats = Counter()
+    rows = clean_ingredients(read_ingredients(path, file_format), stats)
+    loader = copy_ingredients if use_copy else bulk_create_ingredients
+    stats.update(loader(rows, batch_size))
+    if stats['inserted']:
+        transaction.on_commit(lambda: bump_version(INGREDIENTS_VERSION))
+    return stats
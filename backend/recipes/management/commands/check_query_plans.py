@@ -0,0 +1,121 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from recipes.models import Tag
+from users.models import User
+
+ENDPOINTS = (
+    ('/api/recipes/', False),
+    ('/api/recipes/?pagination=cursor', False),
+    ('/api/recipes/?author={user}', False),
+    ('/api/recipes/?tags={tag}', False),
+    ('/api/recipes/?is_favorited=1', True),
+    ('/api/recipes/?is_in_shopping_cart=1', True),
+    ('/api/recipes/shopping_cart_summary/', True),
+    ('/api/users/subscriptions/', True),
+)
+
+
+def plan_nodes(node):
+    yield node
+    for child in node.get('Plans', ()):
+        yield from plan_nodes(child)
+
+
+def sequential_scans(sql):
+    """Таблицы, которые план запроса читает целиком."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return {node['Relation Name']
+                    for node in plan_nodes(plan[0]['Plan'])
+                    if node['Node Type'] == 'Seq Scan'}
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+        tables = set()
+        for row in cursor.fetchall():
+            words = row[-1].split()
+            if words[0] == 'SCAN' and 'INDEX' not in words:
+                tables.add(words[2] if words[1] == 'TABLE' else words[1])
+        return tables & set(connection.introspection.table_names(cursor))
+
+
+def table_rows(table):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class '
+                'WHERE oid = %s::regclass', [table])
+        else:
+            cursor.execute(
+                f'SELECT COUNT(*) FROM {connection.ops.quote_name(table)}')
+        return cursor.fetchone()[0]
+
+
+class Command(BaseCommand):
+    help = ('Проверка планов запросов основных эндпоинтов: EXPLAIN для '
+            'каждого запроса и ошибка при полном чтении больших таблиц.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int,
+            help='id пользователя для эндпоинтов, требующих авторизации.')
+        parser.add_argument(
+            '--min-rows', type=int, default=10000,
+            help='Таблицы меньшего размера можно читать целиком.')
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('pk')
+        if options['user']:
+            users = users.filter(pk=options['user'])
+        user = users.first()
+        tag = Tag.objects.order_by('pk').first()
+        if user is None or tag is None:
+            raise CommandError('Нужны хотя бы один пользователь и тег.')
+        sizes = {}
+        failures = 0
+        for template, authenticated in ENDPOINTS:
+            url = template.format(user=user.pk, tag=tag.slug)
+            client = APIClient()
+            if authenticated:
+                client.force_authenticate(user)
+            # Отдельный пустой кеш, чтобы ответ не брался из кеша.
+            # Остальные кеши, например versions, остаются прежними.
+            caches = dict(settings.CACHES, default={
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': f'check-query-plans:{url}',
+            })
+            with override_settings(CACHES=caches), \
+                    CaptureQueriesContext(connection) as queries:
+                response = client.get(url)
+            if response.status_code != 200:
+                raise CommandError(f'{url}: статус {response.status_code}')
+            scanned = set()
+            for query in queries.captured_queries:
+                if not query['sql'].lstrip().upper().startswith('SELECT'):
+                    continue
+                for table in sequential_scans(query['sql']):
+                    if table not in sizes:
+                        sizes[table] = table_rows(table)
+                    if sizes[table] >= options['min_rows']:
+                        scanned.add(table)
+                        if options['verbosity'] > 1:
+                            self.stdout.write(query['sql'])
+            if scanned:
+                failures += 1
+                self.stdout.write(self.style.ERROR(
+                    f'{url}: полное чтение {", ".join(sorted(scanned))}'))
+            else:
+                self.stdout.write(
+                    f'{url}: запросов {len(queries.captured_queries)}, OK')
+        if failures:
+            raise CommandError(f'Эндпоинтов с полным чтением: {failures}')
+        self.stdout.write(self.style.SUCCESS('Планы запросов в порядке.'))
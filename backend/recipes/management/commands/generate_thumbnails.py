@@ -0,0 +1,24 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from recipes.models import Recipe
+from recipes.thumbnails import generate_thumbnails
+
+
+class Command(BaseCommand):
+    help = 'Создание недостающих миниатюр картинок рецептов.'
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='').exclude(
+            thumbnails_for=F('image')).values_list('pk', 'image')
+        by_image = defaultdict(list)
+        for recipe_id, image_name in recipes.iterator():
+            by_image[image_name].append(recipe_id)
+        count = 0
+        for image_name, recipe_ids in by_image.items():
+            generate_thumbnails(recipe_ids, image_name)
+            count += len(recipe_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано рецептов: {count}'))
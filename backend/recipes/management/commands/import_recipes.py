@@ -0,0 +1,47 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.transfer import import_recipes
+
+
+class Command(BaseCommand):
+    help = ('Загрузка рецептов из файла JSONL, созданного export_recipes. '
+            'Авторы, теги и ингредиенты должны уже существовать.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл JSONL с рецептами.')
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Количество рецептов в одной транзакции.')
+        parser.add_argument(
+            '--resume', action='store_true',
+            help='Продолжить с места, сохраненного в файле <path>.progress.')
+
+    def handle(self, *args, **options):
+        progress_path = options['path'] + '.progress'
+        start = 0
+        if options['resume'] and os.path.exists(progress_path):
+            with open(progress_path) as progress:
+                start = int(progress.read() or 0)
+            self.stdout.write(f'Продолжение со строки {start + 1}')
+
+        def save_progress(position):
+            with open(progress_path, 'w') as progress:
+                progress.write(str(position))
+
+        try:
+            with open(options['path'], encoding='utf-8') as lines:
+                stats = import_recipes(
+                    lines, options['batch_size'], start, save_progress)
+        except OSError as error:
+            raise CommandError(error)
+        if os.path.exists(progress_path):
+            os.remove(progress_path)
+        self.stdout.write(f'Пропущено, уже есть: {stats["existing"]}')
+        self.stdout.write(f'С ошибками: {stats["invalid"]}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено рецептов: {stats["imported"]}'))
+        if stats['imported']:
+            self.stdout.write(
+                'Миниатюры картинок создаются командой generate_thumbnails.')
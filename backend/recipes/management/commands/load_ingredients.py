@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.catalogue import FORMATS, load_ingredients
+
+
+class Command(BaseCommand):
+    help = 'Загрузка каталога ингредиентов из файла csv, json или jsonl.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default='data/ingredients.csv',
+            help='Путь к файлу с ингредиентами.')
+        parser.add_argument(
+            '--format', choices=FORMATS,
+            help='Формат файла, если он не определяется по расширению.')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Количество строк в одной пачке.')
+        parser.add_argument(
+            '--no-copy', action='store_true',
+            help='Не использовать COPY даже на PostgreSQL.')
+
+    def handle(self, *args, **options):
+        try:
+            stats = load_ingredients(
+                options['path'],
+                file_format=options['format'],
+                batch_size=options['batch_size'],
+                use_copy=False if options['no_copy'] else None)
+        except (OSError, ValueError) as error:
+            raise CommandError(error)
+        self.stdout.write(f'Пропущено, уже есть: {stats["skipped"]}')
+        self.stdout.write(f'С ошибками: {stats["invalid"]}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Добавлено ингредиентов: {stats["inserted"]}'))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from recipes.aggregates import (computed_shopping_lists,
+                                rebuild_shopping_lists, stored_shopping_lists)
+
+
+class Command(BaseCommand):
+    help = 'Пересчет и проверка сводных списков покупок пользователей.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, action='append', dest='users',
+            help='id пользователя; по умолчанию все пользователи.')
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='Только сравнить сохраненные итоги с пересчитанными.')
+
+    def handle(self, *args, **options):
+        user_ids = options['users']
+        if not options['verify']:
+            rebuild_shopping_lists(user_ids)
+        computed = computed_shopping_lists(user_ids)
+        stored = stored_shopping_lists(user_ids)
+        mismatched = sorted(
+            user_id for user_id in set(computed) | set(stored)
+            if computed.get(user_id, {}) != stored.get(user_id, {})
+        )
+        for user_id in mismatched:
+            self.stderr.write(f'Расхождение в списке покупок: user={user_id}')
+        if mismatched:
+            self.stderr.write(self.style.ERROR(
+                f'Списков с расхождениями: {len(mismatched)}'))
+            raise SystemExit(1)
+        self.stdout.write(self.style.SUCCESS(
+            f'Списки покупок согласованы: {len(computed)}'))
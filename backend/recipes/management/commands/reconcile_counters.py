@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from recipes.aggregates import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = 'Проверка и исправление денормализованных счетчиков.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать расхождения, не исправляя их.')
+
+    def handle(self, *args, **options):
+        result = reconcile_counters(dry_run=options['dry_run'])
+        for counter, drifted in result.items():
+            self.stdout.write(f'{counter}: {drifted}')
+        action = 'Найдено' if options['dry_run'] else 'Исправлено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} расхождений: {sum(result.values())}'))
@@ -19,18 +19,19 @@ def add_ingredients(apps, schema_editor):
     Ingredient = apps.get_model("recipes", "Ingredient")
     with open('./data/ingredients.json') as json_file:
         data = json.load(json_file)
-    for ingredient in data:
-        new_ingredient = Ingredient(name=ingredient['name'],
-                                    measurement_unit=ingredient['measurement_unit'])
-        new_ingredient.save()
+    Ingredient.objects.bulk_create(
+        Ingredient(name=ingredient['name'],
+                   measurement_unit=ingredient['measurement_unit'])
+        for ingredient in data
+    )
 
 
 def remove_ingredients(apps, schema_editor):
     Ingredient = apps.get_model("recipes", "Ingredient")
     with open(os.path.join('data', 'ingredients.json')) as json_file:
         data = json.load(json_file)
-    for ingredient in data:
-        Ingredient.objects.get(name=ingredient['name']).delete()
+    Ingredient.objects.filter(
+        name__in=[ingredient['name'] for ingredient in data]).delete()
 
 
 def add_tags(apps, schema_editor):
@@ -0,0 +1,52 @@
+# Generated by Django 2.2.19 on 2026-10-17 04:32
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+COUNTERS = (
+    ('recipes', 'Recipe', 'favorites_count', 'recipes', 'Favorite', 'recipe'),
+    ('recipes', 'Recipe', 'shopping_carts_count',
+     'recipes', 'ShoppingCart', 'recipe'),
+    ('users', 'User', 'recipes_count', 'recipes', 'Recipe', 'author'),
+    ('users', 'User', 'followers_count', 'users', 'Subscribtion', 'author'),
+    ('users', 'User', 'following_count', 'users', 'Subscribtion', 'user'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for (app, model, counter,
+         related_app, related_model, field) in COUNTERS:
+        related = apps.get_model(related_app, related_model)
+        apps.get_model(app, model).objects.update(**{counter: Coalesce(
+            Subquery(
+                related.objects.filter(
+                    **{field: OuterRef('pk')}
+                ).order_by().values(field).annotate(
+                    count=Count('pk')).values('count')
+            ), 0)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_counters'),
+        ('recipes', '0007_shopping_list_items'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Добавлений в избранное'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='shopping_carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Добавлений в список покупок'),
+        ),
+        migrations.RunPython(
+            fill_counters,
+            migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.19 on 2026-10-17 04:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='thumbnails_for',
+            field=models.CharField(blank=True, editable=False, max_length=100, verbose_name='Картинка, для которой готовы миниатюры'),
+        ),
+    ]
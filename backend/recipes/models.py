@@ -1,8 +1,10 @@
 from django.core.validators import (MaxValueValidator, MinValueValidator,
                                     RegexValidator)
 from django.db import models
+from django.utils import timezone
 
 from users.models import User
+from .storage import ContentAddressedStorage
 
 ALPHANUMERIC = RegexValidator(
     r'^[0-9a-zA-Z]*$', 'Допустимы только буквы или цифры.'
@@ -79,12 +81,28 @@ class Recipe(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='recipes/images',
+        storage=ContentAddressedStorage(),
         blank=True
     )
+    thumbnails_for = models.CharField(
+        'Картинка, для которой готовы миниатюры',
+        max_length=100,
+        blank=True,
+        editable=False,
+    )
     cooking_time = models.IntegerField(
         "Время приготовления в минутах",
         default=1,
         validators=(MinValueValidator(1, 'Минимум 1 минута'),),)
+    favorites_count = models.PositiveIntegerField(
+        'Добавлений в избранное', default=0, editable=False)
+    shopping_carts_count = models.PositiveIntegerField(
+        'Добавлений в список покупок', default=0, editable=False)
+    updated = models.DateTimeField(
+        'Дата изменения данных рецепта',
+        default=timezone.now,
+        editable=False,
+    )
 
     class Meta:
         verbose_name = 'Рецепт'
@@ -95,6 +113,12 @@ class Recipe(models.Model):
                 fields=["name", "author"], name="unique_for_author"
             )
         ]
+        indexes = (
+            models.Index(fields=('-pub_date', '-id'),
+                         name='recipe_pub_date_id_idx'),
+            models.Index(fields=('author', '-pub_date'),
+                         name='recipe_author_pub_date_idx'),
+        )
 
     def __str__(self) -> str:
         return f'{self.name}. Автор: {self.author.username}'
@@ -158,6 +182,10 @@ class Favorite(models.Model):
                 fields=["recipe", "user", ], name="is_favorite_already"
             )
         ]
+        indexes = (
+            models.Index(fields=('user', 'recipe'),
+                         name='favorite_user_recipe_idx'),
+        )
 
     def __str__(self) -> str:
         return f'{self.user} -> {self.recipe}'
@@ -185,6 +213,41 @@ class ShoppingCart(models.Model):
                 fields=["recipe", "user", ], name="is_in_cart_already"
             )
         ]
+        indexes = (
+            models.Index(fields=('user', 'recipe'),
+                         name='shopping_cart_user_recipe_idx'),
+        )
 
     def __str__(self) -> str:
         return f'{self.user} -> {self.recipe}'
+
+
+class ShoppingListItem(models.Model):
+    """Суммарное количество ингредиента в списке покупок пользователя.
+        Поддерживается приращениями при изменении корзины и рецептов."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+        related_name='shopping_list_items',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент',
+        related_name='shopping_list_items',
+    )
+    total = models.PositiveIntegerField(verbose_name='Количество')
+
+    class Meta:
+        verbose_name = 'Ингредиент списка покупок'
+        verbose_name_plural = 'Ингредиенты списка покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "ingredient"], name="unique_shopping_list_item"
+            )
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.user_id} -> {self.ingredient_id}: {self.total}'
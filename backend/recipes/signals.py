@@ -0,0 +1,262 @@
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from users.models import Subscribtion, User
+from .aggregates import (add_recipe_to_shopping_list, apply_recipe_change,
+                         change_counters, recipe_amounts,
+                         remove_recipe_from_shopping_list)
+from .models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                     ShoppingCart, Tag)
+from .thumbnails import schedule_thumbnails
+from .versions import (INGREDIENTS_VERSION, RECIPE_COUNTS_VERSION,
+                       RECIPE_DATA_VERSION, RECIPE_FRAGMENTS_VERSION,
+                       TAGS_VERSION, bump_version, user_version_name)
+
+USER_PUBLIC_FIELDS = ('username', 'email', 'first_name', 'last_name')
+RELATION_COUNTERS = (
+    (Favorite, Recipe, 'recipe_id', 'favorites_count'),
+    (ShoppingCart, Recipe, 'recipe_id', 'shopping_carts_count'),
+    (Recipe, User, 'author_id', 'recipes_count'),
+    (Subscribtion, User, 'author_id', 'followers_count'),
+    (Subscribtion, User, 'user_id', 'following_count'),
+)
+# Рецепты, удаляемые в текущем потоке: их строки корзин и ингредиентов
+# удаляются каскадно и не должны второй раз менять списки покупок.
+deleting_recipes = threading.local()
+# Признак массового удаления избранного или корзины в текущем потоке:
+# счетчики, списки покупок и версия меняются вызывающим кодом один раз.
+bulk_relation_delete = threading.local()
+
+
+@contextmanager
+def relation_receivers_disabled():
+    """Отключение приемников post_delete для Favorite и ShoppingCart
+        на время массового удаления."""
+    bulk_relation_delete.active = True
+    try:
+        yield
+    finally:
+        bulk_relation_delete.active = False
+
+
+def relation_receivers_enabled():
+    return not getattr(bulk_relation_delete, 'active', False)
+
+
+def bump_after_commit(*names):
+    """Смена версий после фиксации транзакции. Если сменить версию
+        раньше, параллельный запрос успеет прочитать старые данные
+        и закешировать их под новой версией."""
+    def bump():
+        for name in names:
+            bump_version(name)
+    transaction.on_commit(bump)
+
+
+def touch_recipes(recipe_ids):
+    """Обновление отметки изменения рецептов, по которой кешируются
+        их фрагменты в списке."""
+    Recipe.objects.filter(pk__in=recipe_ids).update(updated=timezone.now())
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredients_changed(sender, **kwargs):
+    """Сброс версии каталога ингредиентов."""
+    bump_after_commit(
+        INGREDIENTS_VERSION, RECIPE_DATA_VERSION, RECIPE_FRAGMENTS_VERSION)
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def tags_changed(sender, **kwargs):
+    """Сброс версии списка тегов."""
+    bump_after_commit(
+        TAGS_VERSION, RECIPE_DATA_VERSION, RECIPE_FRAGMENTS_VERSION)
+
+
+@receiver(pre_save, sender=Recipe)
+def recipe_saving(sender, instance, raw=False, **kwargs):
+    if not raw:
+        instance.updated = timezone.now()
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipes_changed(sender, **kwargs):
+    """Сброс закешированных количеств и ответов со списком рецептов."""
+    bump_after_commit(RECIPE_COUNTS_VERSION, RECIPE_DATA_VERSION)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, **kwargs):
+    """Смена тегов рецепта меняет только его фрагмент. Изменение
+        рецептов со стороны тега затрагивает многие рецепты, поэтому
+        сбрасывается общая версия фрагментов."""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        bump_after_commit(RECIPE_FRAGMENTS_VERSION)
+    else:
+        touch_recipes([instance.pk])
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_saved(sender, instance, raw=False, **kwargs):
+    """Создание миниатюр новой картинки после фиксации транзакции.
+        Для записей из фикстур файлы картинок могут еще отсутствовать,
+        миниатюры для них создаются командой generate_thumbnails."""
+    if raw:
+        return
+    if instance.image and instance.thumbnails_for != instance.image.name:
+        transaction.on_commit(lambda: schedule_thumbnails(instance))
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def recipe_ingredients_changed(sender, instance, raw=False, **kwargs):
+    """Сброс закешированных ответов со списком рецептов
+        и фрагмента измененного рецепта."""
+    bump_after_commit(RECIPE_DATA_VERSION)
+    if not raw and not recipe_is_deleting(instance.recipe_id):
+        touch_recipes([instance.recipe_id])
+
+
+@receiver(pre_save, sender=User)
+def user_saving(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Запоминание сохраненных публичных полей пользователя."""
+    instance.saved_public_fields = None
+    if (instance.pk and not raw and (
+            update_fields is None
+            or set(USER_PUBLIC_FIELDS) & set(update_fields))):
+        instance.saved_public_fields = User.objects.filter(
+            pk=instance.pk).values(*USER_PUBLIC_FIELDS).first()
+
+
+@receiver(post_save, sender=User)
+def users_changed(sender, instance, created, **kwargs):
+    """Сброс закешированных ответов при изменении данных автора.
+        Регистрация, смена пароля и обновление служебных полей,
+        например last_login, версию не меняют. Рецепты удаляемого
+        пользователя сбрасывают версию сами."""
+    saved = getattr(instance, 'saved_public_fields', None)
+    if created or saved is None:
+        return
+    if any(getattr(instance, field) != saved[field]
+           for field in USER_PUBLIC_FIELDS):
+        bump_after_commit(RECIPE_DATA_VERSION, RECIPE_FRAGMENTS_VERSION)
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+@receiver((post_save, post_delete), sender=ShoppingCart)
+def user_recipes_changed(sender, instance, **kwargs):
+    """Сброс закешированных количеств рецептов пользователя
+        для фильтров по избранному и корзине."""
+    if relation_receivers_enabled():
+        bump_after_commit(
+            user_version_name(RECIPE_COUNTS_VERSION, instance.user_id))
+
+
+def change_relation_counters(sender, instance, delta):
+    for model, counted_model, field, counter in RELATION_COUNTERS:
+        if model is sender:
+            change_counters(
+                counted_model.objects.filter(pk=getattr(instance, field)),
+                **{counter: delta})
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Subscribtion)
+def relation_created(sender, instance, created, raw=False, **kwargs):
+    """Увеличение счетчиков при любом способе создания записи,
+        включая админку. Записи из фикстур не учитываются: после
+        loaddata счетчики пересчитываются командой reconcile_counters."""
+    if created and not raw:
+        change_relation_counters(sender, instance, 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Subscribtion)
+def relation_deleted(sender, instance, **kwargs):
+    """Уменьшение счетчиков при удалении записи, в том числе каскадном."""
+    if relation_receivers_enabled():
+        change_relation_counters(sender, instance, -1)
+
+
+def recipe_is_deleting(recipe_id):
+    return recipe_id in getattr(deleting_recipes, 'ids', ())
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleting(sender, instance, **kwargs):
+    """Удаление ингредиентов рецепта из списков покупок до каскадного
+        удаления корзин и строк ингредиентов."""
+    apply_recipe_change(instance.id, recipe_amounts(instance.id), {})
+    if not hasattr(deleting_recipes, 'ids'):
+        deleting_recipes.ids = set()
+    deleting_recipes.ids.add(instance.id)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    getattr(deleting_recipes, 'ids', set()).discard(instance.id)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def shopping_cart_added(sender, instance, created, raw=False, **kwargs):
+    """Добавление ингредиентов рецепта в список покупок при любом
+        способе создания записи корзины, включая админку. Для записей
+        из фикстур списки пересоздаются командой rebuild_shopping_lists."""
+    if created and not raw:
+        add_recipe_to_shopping_list(instance.user_id, instance.recipe_id)
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def shopping_cart_removed(sender, instance, **kwargs):
+    if (relation_receivers_enabled()
+            and not recipe_is_deleting(instance.recipe_id)):
+        remove_recipe_from_shopping_list(
+            instance.user_id, instance.recipe_id)
+
+
+@receiver(pre_save, sender=RecipeIngredient)
+def recipe_ingredient_saving(sender, instance, raw=False, **kwargs):
+    """Запоминание сохраненного количества для расчета приращения."""
+    instance.saved_amount = None
+    if instance.pk and not raw:
+        instance.saved_amount = RecipeIngredient.objects.filter(
+            pk=instance.pk
+        ).values_list('recipe_id', 'ingredient_id', 'amount').first()
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def recipe_ingredient_saved(sender, instance, raw=False, **kwargs):
+    """Перенос изменения строки ингредиента, например из админки,
+        в списки покупок. Массовые операции сериализатора сигналы
+        не отправляют и применяют приращения сами."""
+    if raw:
+        return
+    old_amounts = {}
+    if instance.saved_amount is not None:
+        recipe_id, ingredient_id, amount = instance.saved_amount
+        if recipe_id == instance.recipe_id:
+            old_amounts = {ingredient_id: amount}
+        else:
+            apply_recipe_change(recipe_id, {ingredient_id: amount}, {})
+    apply_recipe_change(
+        instance.recipe_id, old_amounts,
+        {instance.ingredient_id: instance.amount})
+
+
+@receiver(post_delete, sender=RecipeIngredient)
+def recipe_ingredient_deleted(sender, instance, **kwargs):
+    if not recipe_is_deleting(instance.recipe_id):
+        apply_recipe_change(
+            instance.recipe_id, {instance.ingredient_id: instance.amount}, {})
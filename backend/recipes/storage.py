@@ -0,0 +1,55 @@
+import hashlib
+import os
+import posixpath
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, называющее файлы по SHA-256 содержимого.
+        Одинаковые файлы сохраняются один раз, а имена никогда
+        не переиспользуются для другого содержимого, поэтому файлы
+        можно отдавать с долгим неизменяемым кешированием."""
+
+    def content_name(self, name, content):
+        digest = hashlib.sha256()
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        extension = os.path.splitext(name)[1].lower()
+        return posixpath.join(
+            posixpath.dirname(name), digest.hexdigest() + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        # Имя определяется содержимым, поэтому get_available_name
+        # не вызывается: подбирать для него свободный вариант не нужно.
+        return self._save(
+            self.content_name(name, content), content).replace('\\', '/')
+
+    def get_available_name(self, name, max_length=None):
+        """Вызывается FileSystemStorage._save, если файл появился
+            во время записи. Файл с тем же именем уже содержит те же
+            данные, поэтому вместо нового имени выбрасывается ошибка,
+            которую обрабатывает _save."""
+        if self.exists(name):
+            raise FileExistsError(name)
+        return super().get_available_name(name, max_length)
+
+    def _save(self, name, content):
+        if self.exists(name):
+            return name
+        try:
+            return super()._save(name, content)
+        except FileExistsError:
+            # Тот же файл одновременно сохранил другой запрос.
+            return name
@@ -0,0 +1,150 @@
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+from django.utils import timezone
+from PIL import Image
+
+from .versions import RECIPE_DATA_VERSION, bump_version
+
+logger = logging.getLogger(__name__)
+
+THUMBNAILS_DIR = 'recipes/thumbnails'
+THUMBNAIL_VARIANTS = {
+    'card': 400,
+    'detail': 800,
+    'retina': 1600,
+}
+THUMBNAIL_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+_executor = None
+# Рецепты, ожидающие миниатюр, по имени картинки. Одинаковые картинки
+# хранятся в одном файле, поэтому на картинку ставится одна задача.
+_pending = {}
+_pending_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            thread_name_prefix='thumbnails')
+    return _executor
+
+
+def thumbnail_name(image_name, variant, extension):
+    """Имя файла миниатюры для картинки рецепта."""
+    base = os.path.splitext(os.path.basename(image_name))[0]
+    return f'{THUMBNAILS_DIR}/{base}_{variant}.{extension}'
+
+
+def thumbnail_names(image_name):
+    """{variant: {format: name}} для всех миниатюр картинки."""
+    return {
+        variant: {
+            extension: thumbnail_name(image_name, variant, extension)
+            for extension in THUMBNAIL_FORMATS
+        }
+        for variant in THUMBNAIL_VARIANTS
+    }
+
+
+def render_thumbnails(image_name):
+    """Создание миниатюр всех размеров в форматах WebP и JPEG."""
+    with default_storage.open(image_name) as source:
+        original = Image.open(source)
+        original.load()
+    if original.mode not in ('RGB', 'L'):
+        background = Image.new('RGB', original.size, (255, 255, 255))
+        rgba = original.convert('RGBA')
+        background.paste(rgba, mask=rgba.split()[-1])
+        original = background
+    for variant, width in THUMBNAIL_VARIANTS.items():
+        image = original.copy()
+        image.thumbnail((width, width * 4), Image.LANCZOS)
+        for extension, (image_format, options) in THUMBNAIL_FORMATS.items():
+            buffer = BytesIO()
+            image.save(buffer, image_format, **options)
+            write_thumbnail(
+                thumbnail_name(image_name, variant, extension),
+                buffer.getvalue())
+
+
+def write_thumbnail(name, data):
+    """Запись миниатюры под постоянным именем через временный файл
+        и os.replace. Параллельные задачи для одной картинки не создают
+        файлов с суффиксами, а уже опубликованная миниатюра
+        не пропадает на время записи."""
+    path = default_storage.path(name)
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+            dir=directory, prefix='.tmp-', delete=False) as file:
+        file.write(data)
+    try:
+        os.chmod(file.name, default_storage.file_permissions_mode or 0o644)
+        os.replace(file.name, path)
+    except OSError:
+        os.remove(file.name)
+        raise
+
+
+def generate_thumbnails(recipe_ids, image_name):
+    """Миниатюры картинки для рецептов с этой картинкой.
+        Уже существующие миниатюры той же картинки не пересоздаются.
+        После создания файлов рецепты помечаются готовыми,
+        если их картинка за это время не сменилась."""
+    from .models import Recipe
+
+    names = [name for formats in thumbnail_names(image_name).values()
+             for name in formats.values()]
+    try:
+        if not all(default_storage.exists(name) for name in names):
+            render_thumbnails(image_name)
+    except Exception:
+        logger.exception(
+            'Не удалось создать миниатюры для рецептов %s', recipe_ids)
+        return
+    updated = Recipe.objects.filter(
+        pk__in=recipe_ids, image=image_name
+    ).update(thumbnails_for=image_name, updated=timezone.now())
+    if updated:
+        bump_version(RECIPE_DATA_VERSION)
+
+
+def run_in_worker(image_name):
+    """Выполнение задачи в потоке пула с собственным соединением с БД.
+        Задача обрабатывает все рецепты, поставленные в ожидание
+        с этой картинкой до ее начала."""
+    with _pending_lock:
+        recipe_ids = _pending.pop(image_name)
+    close_old_connections()
+    try:
+        generate_thumbnails(recipe_ids, image_name)
+    except Exception:
+        logger.exception(
+            'Не удалось сохранить миниатюры для рецептов %s', recipe_ids)
+    finally:
+        close_old_connections()
+
+
+def schedule_thumbnails(recipe):
+    """Постановка рецепта в очередь фонового пула. Если задача
+        для той же картинки еще не началась, рецепт добавляется к ней."""
+    image_name = recipe.image.name
+    with _pending_lock:
+        if image_name in _pending:
+            _pending[image_name].add(recipe.pk)
+            return None
+        _pending[image_name] = {recipe.pk}
+    return get_executor().submit(run_in_worker, image_name)
@@ -0,0 +1,171 @@
+import json
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
+from django.utils.dateparse import parse_datetime
+
+from users.models import User
+from .aggregates import change_counters
+from .catalogue import batches
+from .models import Ingredient, Recipe, RecipeIngredient, Tag
+from .versions import RECIPE_COUNTS_VERSION, RECIPE_DATA_VERSION, bump_version
+
+
+def recipe_record(recipe):
+    """Рецепт в виде словаря для одной строки JSONL. Автор, теги
+        и ингредиенты указываются естественными ключами, а не id."""
+    return {
+        'name': recipe.name,
+        'text': recipe.text,
+        'cooking_time': recipe.cooking_time,
+        'pub_date': recipe.pub_date.isoformat(),
+        'author': recipe.author.email,
+        'tags': sorted(tag.slug for tag in recipe.tags.all()),
+        'ingredients': [
+            {'name': row.ingredient.name,
+             'measurement_unit': row.ingredient.measurement_unit,
+             'amount': row.amount}
+            for row in recipe.recipeingredient_set.all()
+        ],
+        'image': recipe.image.name,
+    }
+
+
+def export_recipes(batch_size=500):
+    """Строки JSONL со всеми рецептами по порядку id.
+        В памяти одновременно находится не больше batch_size рецептов."""
+    last_id = 0
+    while True:
+        recipes = list(Recipe.objects.filter(
+            pk__gt=last_id).select_related('author').order_by('pk')[
+            :batch_size])
+        if not recipes:
+            return
+        prefetch_related_objects(
+            recipes, 'tags',
+            Prefetch('recipeingredient_set',
+                     queryset=RecipeIngredient.objects.select_related(
+                         'ingredient').order_by('pk')))
+        for recipe in recipes:
+            yield json.dumps(recipe_record(recipe), ensure_ascii=False)
+        last_id = recipes[-1].pk
+
+
+def parse_record(line):
+    """Проверенная запись рецепта или None, если строка ошибочна."""
+    try:
+        record = json.loads(line)
+        record['cooking_time'] = int(record['cooking_time'])
+        record['ingredients'] = [
+            ((item['name'], item['measurement_unit']), int(item['amount']))
+            for item in record['ingredients']]
+        if (not record['name'] or not record['author']
+                or record['cooking_time'] < 1
+                or not record['ingredients']
+                or any(amount < 1 for _, amount in record['ingredients'])):
+            return None
+        record['tags'] = list(record.get('tags', ()))
+        record['pub_date'] = parse_datetime(record.get('pub_date') or '')
+    except (KeyError, TypeError, ValueError):
+        return None
+    return record
+
+
+@transaction.atomic
+def import_recipe_batch(records, tags, stats):
+    """Сохранение пачки рецептов: по одному bulk_create для рецептов,
+        их ингредиентов и тегов. Рецепты, которые уже есть у автора,
+        пропускаются, поэтому повторный импорт безопасен."""
+    authors = dict(User.objects.filter(
+        email__in={record['author'] for record in records}
+    ).values_list('email', 'pk'))
+    ingredient_keys = {key for record in records
+                       for key, _ in record['ingredients']}
+    ingredients = {
+        (name, unit): pk
+        for pk, name, unit in Ingredient.objects.filter(
+            name__in={name for name, _ in ingredient_keys}
+        ).values_list('pk', 'name', 'measurement_unit')
+    }
+    existing = set(Recipe.objects.filter(
+        author_id__in=authors.values(),
+        name__in={record['name'] for record in records}
+    ).values_list('author_id', 'name'))
+    new = {}
+    for record in records:
+        author_id = authors.get(record['author'])
+        if (author_id is None
+                or any(slug not in tags for slug in record['tags'])
+                or any(key not in ingredients
+                       for key, _ in record['ingredients'])):
+            stats['invalid'] += 1
+            continue
+        key = (author_id, record['name'])
+        if key in existing or key in new:
+            stats['existing'] += 1
+            continue
+        new[key] = record
+    if not new:
+        return
+    Recipe.objects.bulk_create(
+        Recipe(author_id=author_id, name=name, text=record['text'],
+               cooking_time=record['cooking_time'],
+               image=record.get('image') or '')
+        for (author_id, name), record in new.items())
+    recipe_ids = {
+        (author_id, name): pk
+        for pk, author_id, name in Recipe.objects.filter(
+            author_id__in={author_id for author_id, _ in new},
+            name__in={name for _, name in new}
+        ).values_list('pk', 'author_id', 'name')
+    }
+    # pub_date заполняется при вставке текущим временем (auto_now_add),
+    # поэтому исходные даты публикации переносятся отдельным запросом.
+    Recipe.objects.bulk_update([
+        Recipe(pk=recipe_ids[key], pub_date=record['pub_date'])
+        for key, record in new.items() if record['pub_date']
+    ], ('pub_date',))
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(recipe_id=recipe_ids[key],
+                         ingredient_id=ingredients[ingredient_key],
+                         amount=amount)
+        for key, record in new.items()
+        for ingredient_key, amount in record['ingredients'])
+    Recipe.tags.through.objects.bulk_create(
+        Recipe.tags.through(recipe_id=recipe_ids[key], tag_id=tags[slug])
+        for key, record in new.items()
+        for slug in set(record['tags']))
+    authors_by_count = defaultdict(list)
+    for author_id, count in Counter(
+            author_id for author_id, _ in new).items():
+        authors_by_count[count].append(author_id)
+    for count, author_ids in authors_by_count.items():
+        change_counters(
+            User.objects.filter(pk__in=author_ids), recipes_count=count)
+    stats['imported'] += len(new)
+    transaction.on_commit(lambda: (bump_version(RECIPE_COUNTS_VERSION),
+                                   bump_version(RECIPE_DATA_VERSION)))
+
+
+def import_recipes(lines, batch_size=500, start=0, on_batch=None):
+    """Импорт рецептов из строк JSONL пачками по batch_size.
+        Первые start строк пропускаются; после каждой сохраненной пачки
+        вызывается on_batch с номером следующей строки."""
+    stats = Counter()
+    tags = dict(Tag.objects.values_list('slug', 'pk'))
+    numbered = ((number, line) for number, line in enumerate(lines)
+                if number >= start and line.strip())
+    for batch in batches(numbered, batch_size):
+        records = []
+        for _, line in batch:
+            record = parse_record(line)
+            if record is None:
+                stats['invalid'] += 1
+            else:
+                records.append(record)
+        if records:
+            import_recipe_batch(records, tags, stats)
+        if on_batch is not None:
+            on_batch(batch[-1][0] + 1)
+    return stats
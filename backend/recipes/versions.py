@@ -0,0 +1,50 @@
+import time
+from uuid import uuid4
+
+from django.core.cache import caches
+
+VERSION_KEY_PREFIX = 'data-version'
+INGREDIENTS_VERSION = 'ingredients'
+TAGS_VERSION = 'tags'
+RECIPE_COUNTS_VERSION = 'recipe-counts'
+RECIPE_DATA_VERSION = 'recipe-data'
+# Общая версия фрагментов рецептов: меняется только при изменении данных,
+# которые входят во многие рецепты (авторы, теги, ингредиенты).
+RECIPE_FRAGMENTS_VERSION = 'recipe-fragments'
+
+
+def _version_key(name):
+    return f'{VERSION_KEY_PREFIX}:{name}'
+
+
+def user_version_name(name, user_id):
+    """Имя версии данных конкретного пользователя."""
+    return f'{name}:user:{user_id}'
+
+
+def new_version():
+    """Новая версия: время изменения и случайный суффикс."""
+    return f'{int(time.time())}.{uuid4().hex}'
+
+
+def version_timestamp(version):
+    """Время изменения данных, записанное в версии."""
+    return int(version.split('.', 1)[0])
+
+
+def get_version(name):
+    """Текущая версия набора данных.
+        Хранится в отдельном кеше versions, общем для всех процессов
+        gunicorn, и не вытесняется при переполнении основного кеша."""
+    cache = caches['versions']
+    key = _version_key(name)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, new_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(name):
+    """Смена версии набора данных после изменения записей."""
+    caches['versions'].set(_version_key(name), new_version(), timeout=None)
@@ -5,11 +5,21 @@ from .models import Subscribtion, User
 
 class UserAdmin(admin.ModelAdmin):
     list_display = ('id', 'username', 'password',
-                    'email', 'first_name', 'last_name')
-    search_fields = ('username',)
-    list_filter = ('email', 'username',)
+                    'email', 'first_name', 'last_name',
+                    'recipes_count', 'followers_count', 'following_count')
+    search_fields = ('username', 'email')
+    list_filter = ('is_staff', 'is_active')
     empty_value_display = '-empty-'
+    show_full_result_count = False
+
+
+class SubscribtionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'author')
+    list_select_related = ('user', 'author')
+    autocomplete_fields = ('user', 'author')
+    search_fields = ('user__username', 'author__username')
+    show_full_result_count = False
 
 
 admin.site.register(User, UserAdmin)
-admin.site.register(Subscribtion)
+admin.site.register(Subscribtion, SubscribtionAdmin)
@@ -6,6 +6,12 @@ class User(AbstractUser):
     """Модель пользователя"""
 
     email = models.EmailField(max_length=254, unique=True)
+    recipes_count = models.PositiveIntegerField(
+        'Рецептов', default=0, editable=False)
+    followers_count = models.PositiveIntegerField(
+        'Подписчиков', default=0, editable=False)
+    following_count = models.PositiveIntegerField(
+        'Подписок', default=0, editable=False)
 
     class Meta:
         ordering = ['id']